@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Benchmark the memory, speed and accuracy of `pytutils.iters.dedupe_iter` stores.
+
+Feeds `--count` distinct items through `dedupe_iter` with each store, then reports the memory it holds (traced with
+`tracemalloc`) per million items, items per second, and the share of `--count` further distinct items it wrongly
+holds as seen.
+
+    bin/bench-dedupe-memory.py --count 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pytutils.iters import consume, dedupe_iter  # noqa: E402
+from pytutils.sets import BloomFilter, CuckooFilter, TTLSet  # noqa: E402
+
+
+def stores(count):
+    return [
+        ('set (default)', set),
+        ('TTLSet(maxlen=count)', lambda: TTLSet(maxlen=count)),
+        ('BloomFilter(error_rate=0.01)', lambda: BloomFilter(capacity=count, error_rate=0.01)),
+        ('BloomFilter(error_rate=0.001)', lambda: BloomFilter(capacity=count, error_rate=0.001)),
+        ('CuckooFilter', lambda: CuckooFilter(capacity=count)),
+    ]
+
+
+def fill(done, count):
+    consume(dedupe_iter(('item %d' % i for i in range(count)), done=done))
+    return done
+
+
+def measure(make_store, count):
+    # Timed and traced in separate runs, as tracing slows allocations down
+    started = time.perf_counter()
+    done = fill(make_store(), count)
+    elapsed = time.perf_counter() - started
+
+    del done
+    tracemalloc.start()
+    done = fill(make_store(), count)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Only look up, as adding would push the store past its capacity
+    false_positives = sum(1 for i in range(count) if hash('other %d' % i) in done)
+    return size, elapsed, false_positives
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000000, help='Number of distinct items')
+    args = parser.parse_args(argv)
+
+    per_million = 1000000.0 / args.count
+    print('%-30s %14s %12s %12s' % ('store', 'MiB/1M items', 'items/s', 'false pos.'))
+    for name, make_store in stores(args.count):
+        size, elapsed, false_positives = measure(make_store, args.count)
+        print('%-30s %14.1f %12d %11.3f%%' % (
+            name, size * per_million / 1024 / 1024, args.count / elapsed, 100.0 * false_positives / args.count
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Benchmark the `pytutils.files` readers against plain line mode `islurp`.
+
+Writes a file of `--size` MiB of lines, then reads it through each reader, reporting the best of `--repeat` runs.
+
+    bin/bench-islurp.py --size 256 --repeat 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pytutils import files  # noqa: E402
+
+
+def make_file(path, size, line_length):
+    line = ('x' * (line_length - 1) + '\n').encode()
+    with open(path, 'wb') as fh:
+        block = line * max(1, (1024 * 1024) // len(line))
+        written = 0
+        while written < size:
+            fh.write(block)
+            written += len(block)
+    return os.path.getsize(path)
+
+
+def readers(path):
+    return [
+        ('islurp, text lines', lambda: files.islurp(path, compression=None)),
+        ('islurp, binary lines', lambda: files.islurp(path, mode='rb', compression=None)),
+        ('islurp, 1MiB chunks', lambda: files.islurp(path, mode='rb', iter_by=files.DEFAULT_CHUNK_SIZE, compression=None)),
+        ('islurp_into, 1MiB chunks', lambda: files.islurp_into(path)),
+        ('islurp_mmap, lines', lambda: files.islurp_mmap(path)),
+    ]
+
+
+def run(make_gen, repeat):
+    best, count = None, 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = 0
+        for _ in make_gen():
+            count += 1
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=128, help='File size in MiB')
+    parser.add_argument('--line-length', type=int, default=80, help='Bytes per line')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per reader; the best is reported')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'bench.txt')
+        size = make_file(path, args.size * 1024 * 1024, args.line_length)
+
+        baseline = None
+        print('%-28s %10s %12s %10s %8s' % ('reader', 'seconds', 'items', 'MiB/s', 'speedup'))
+        for name, make_gen in readers(path):
+            elapsed, count = run(make_gen, args.repeat)
+            baseline = baseline or elapsed
+            print('%-28s %10.3f %12d %10.1f %7.1fx' % (
+                name, elapsed, count, size / elapsed / 1024 / 1024, baseline / elapsed
+            ))
+
+
+if __name__ == '__main__':
+    main()
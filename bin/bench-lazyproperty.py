@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Benchmark `pytutils.memo.lazyproperty` against the hasattr/getattr property it replaced and the stdlib alternatives.
+
+Reports the cost of the first (computing) access on fresh instances, and of repeated (cached) accesses, in
+nanoseconds each; the best of `--repeat` runs.
+
+    bin/bench-lazyproperty.py --count 1000000
+"""
+import argparse
+import functools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pytutils.memo import lazyproperty  # noqa: E402
+
+
+def previous_lazyproperty(fn):
+    """`lazyproperty` as it was: a property doing hasattr then getattr on each access."""
+    attr_name = '_lazy_' + fn.__name__
+
+    @property
+    def _lazyprop(self):
+        if not hasattr(self, attr_name):
+            setattr(self, attr_name, fn(self))
+        return getattr(self, attr_name)
+
+    return _lazyprop
+
+
+def make_classes():
+    class Previous(object):
+        @previous_lazyproperty
+        def value(self):
+            return 42
+
+    class Lazy(object):
+        @lazyproperty
+        def value(self):
+            return 42
+
+    class LazyLocked(object):
+        @lazyproperty(lock=True)
+        def value(self):
+            return 42
+
+    class LazySlotted(object):
+        __slots__ = ('_lazy_value', )
+
+        @lazyproperty
+        def value(self):
+            return 42
+
+    classes = [
+        ('previous lazyproperty', Previous),
+        ('lazyproperty', Lazy),
+        ('lazyproperty(lock=True)', LazyLocked),
+        ('lazyproperty, __slots__', LazySlotted),
+    ]
+
+    cached_property = getattr(functools, 'cached_property', None)
+    if cached_property is not None:
+        class CachedProperty(object):
+            @cached_property
+            def value(self):
+                return 42
+
+        classes.append(('functools.cached_property', CachedProperty))
+
+    return classes
+
+
+def best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        elapsed = func()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def first_access(cls, count):
+    instances = [cls() for _ in range(count)]
+    started = time.perf_counter()
+    for instance in instances:
+        instance.value
+    return time.perf_counter() - started
+
+
+def cached_access(cls, count):
+    instance = cls()
+    instance.value
+    started = time.perf_counter()
+    for _ in range(count):
+        instance.value
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000000, help='Accesses per run')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per variant; the best is reported')
+    args = parser.parse_args(argv)
+
+    print('%-28s %16s %16s' % ('property', 'ns/first access', 'ns/cached access'))
+    for name, cls in make_classes():
+        first = best_of(args.repeat, lambda: first_access(cls, args.count))
+        cached = best_of(args.repeat, lambda: cached_access(cls, args.count))
+        print('%-28s %16.1f %16.1f' % (name, first / args.count * 1e9, cached / args.count * 1e9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Benchmark `pytutils.trees.PersistentTree` against a `Tree` guarded by a lock, with concurrent readers and a writer.
+
+`--readers` threads read random paths for `--duration` seconds while one thread keeps writing to random paths, for
+each tree; reports reads and writes per second. Readers of the `Tree` take the lock writers take, as they would have
+to for consistent reads; `PersistentTree` readers never lock. Also reports the cost of a single write on its own.
+
+    bin/bench-persistent-tree.py --count 10000 --readers 4
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pytutils.trees import PersistentTree, Tree  # noqa: E402
+
+
+def make_paths(count, fanout=16):
+    paths = []
+    for i in range(count):
+        i, a = divmod(i, fanout)
+        i, b = divmod(i, fanout)
+        paths.append('node%d:node%d:leaf%d' % (a, b, i))
+    return paths
+
+
+class LockedTree(object):
+    def __init__(self, leaves):
+        self.tree = Tree(leaves)
+        self.lock = threading.Lock()
+
+    def read(self, path):
+        with self.lock:
+            return self.tree[path]
+
+    def write(self, path, value):
+        with self.lock:
+            self.tree[path] = value
+
+
+class Persistent(object):
+    def __init__(self, leaves):
+        self.tree = PersistentTree(leaves)
+
+    def read(self, path):
+        return self.tree[path]
+
+    def write(self, path, value):
+        self.tree[path] = value
+
+
+def contend(tree, paths, readers, duration):
+    stop = threading.Event()
+    counts = []
+
+    def read():
+        count, choice = 0, random.choice
+        while not stop.is_set():
+            for _ in range(100):
+                tree.read(choice(paths))
+            count += 100
+        counts.append(count)
+
+    def write():
+        count, choice = 0, random.choice
+        while not stop.is_set():
+            tree.write(choice(paths), count)
+            count += 1
+        counts.append(-count)
+
+    threads = [threading.Thread(target=read) for _ in range(readers)] + [threading.Thread(target=write)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    reads = sum(count for count in counts if count > 0)
+    writes = -sum(count for count in counts if count < 0)
+    return reads / duration, writes / duration
+
+
+def write_cost(tree, paths, count):
+    writes = [random.choice(paths) for _ in range(count)]
+    started = time.perf_counter()
+    for i, path in enumerate(writes):
+        tree.write(path, i)
+    return (time.perf_counter() - started) / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=10000, help='Number of leaves')
+    parser.add_argument('--readers', type=int, default=4, help='Reader threads')
+    parser.add_argument('--duration', type=float, default=2.0, help='Seconds to run each tree for')
+    args = parser.parse_args(argv)
+
+    paths = make_paths(args.count)
+    leaves = dict.fromkeys(paths, 0)
+
+    print('%-22s %14s %14s %14s' % ('tree', 'reads/s', 'writes/s', 'us/write alone'))
+    for name, make_tree in [('Tree + Lock', LockedTree), ('PersistentTree', Persistent)]:
+        reads, writes = contend(make_tree(leaves), paths, args.readers, args.duration)
+        cost = write_cost(make_tree(leaves), paths, 20000)
+        print('%-22s %14d %14d %14.2f' % (name, reads, writes, cost * 1e6))
+
+
+if __name__ == '__main__':
+    main()
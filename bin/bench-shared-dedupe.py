@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Benchmark how deduping with a shared `pytutils.sets.SharedMemorySet` scales from 1 to `--processes` processes.
+
+`--count` items, each repeated `--repeats` times, are split evenly over the worker processes, which all dedupe
+against one shared set. Reports the wall time of the dedupe itself (process start up is excluded), throughput,
+speedup over one process, and checks every distinct item came out exactly once. The first line is a plain `set` in
+a single process, for reference.
+
+    bin/bench-shared-dedupe.py --count 1000000 --processes 8
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pytutils.iters import dedupe_iter  # noqa: E402
+from pytutils.sets import SharedMemorySet  # noqa: E402
+
+
+def items(count, repeats, worker=0, workers=1):
+    return ('item %d' % (i % count) for i in range(worker, count * repeats, workers))
+
+
+def work(seen, barrier, results, count, repeats, worker, workers):
+    barrier.wait()
+    started = time.perf_counter()
+    unique = sum(1 for _ in dedupe_iter(items(count, repeats, worker, workers), done=seen))
+    results.put((started, time.perf_counter(), unique))
+
+
+def run(count, repeats, workers, context):
+    seen = SharedMemorySet(capacity=count, context=context)
+    barrier, results = context.Barrier(workers), context.Queue()
+    procs = [
+        context.Process(target=work, args=(seen, barrier, results, count, repeats, worker, workers))
+        for worker in range(workers)
+    ]
+    try:
+        for proc in procs:
+            proc.start()
+        outcomes = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+    finally:
+        seen.unlink()
+
+    started = min(outcome[0] for outcome in outcomes)
+    finished = max(outcome[1] for outcome in outcomes)
+    return finished - started, sum(outcome[2] for outcome in outcomes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000000, help='Number of distinct items')
+    parser.add_argument('--repeats', type=int, default=2, help='Times each item is repeated')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Most processes to try')
+    parser.add_argument('--start-method', default=None, help='multiprocessing start method, ie spawn')
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context(args.start_method)
+    total = args.count * args.repeats
+
+    started = time.perf_counter()
+    unique = sum(1 for _ in dedupe_iter(items(args.count, args.repeats)))
+    elapsed = time.perf_counter() - started
+    print('%-14s %10s %14s %8s %s' % ('processes', 'seconds', 'items/s', 'speedup', 'distinct'))
+    print('%-14s %10.3f %14d %8s %s' % ('1 (set)', elapsed, total / elapsed, '', unique == args.count))
+
+    baseline = None
+    for workers in range(1, args.processes + 1):
+        elapsed, unique = run(args.count, args.repeats, workers, context)
+        baseline = baseline or elapsed
+        print('%-14d %10.3f %14d %7.1fx %s' % (
+            workers, elapsed, total / elapsed, baseline / elapsed, unique == args.count
+        ))
+
+
+if __name__ == '__main__':
+    main()
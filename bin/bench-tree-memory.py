@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Benchmark the memory of `pytutils.trees.CompactTree` against `Tree`, with and without its flat index.
+
+Builds each from the same `--count` leaves, `--fanout` children per node, and reports the memory it holds (traced
+with `tracemalloc`) in bytes per leaf, and the time taken to build it.
+
+    bin/bench-tree-memory.py --count 1000000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pytutils.trees import CompactTree, Tree  # noqa: E402
+
+
+def make_paths(count, fanout):
+    paths = []
+    for i in range(count):
+        segments = []
+        for _ in range(3):
+            i, segment = divmod(i, fanout)
+            segments.append('node%d' % segment)
+        paths.append(':'.join(segments + ['leaf%d' % i]))
+    return paths
+
+
+def trees(paths):
+    return [
+        ('Tree', lambda: Tree(dict.fromkeys(paths, 1))),
+        ('Tree(index=False)', lambda: Tree(dict.fromkeys(paths, 1), index=False)),
+        ('CompactTree', lambda: CompactTree(dict.fromkeys(paths, 1))),
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000000, help='Number of leaves')
+    parser.add_argument('--fanout', type=int, default=16, help='Children per interior node')
+    args = parser.parse_args(argv)
+
+    paths = make_paths(args.count, args.fanout)
+
+    print('%-20s %14s %10s' % ('tree', 'bytes/leaf', 'seconds'))
+    for name, build in trees(paths):
+        # Timed and traced in separate runs, as tracing slows allocations down
+        started = time.perf_counter()
+        tree = build()
+        elapsed = time.perf_counter() - started
+        del tree
+
+        tracemalloc.start()
+        tree = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del tree
+
+        print('%-20s %14.1f %10.3f' % (name, float(size) / args.count, elapsed))
+
+
+if __name__ == '__main__':
+    main()
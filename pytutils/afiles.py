@@ -0,0 +1,64 @@
+"""
+Asyncio counterparts to `pytutils.files`.
+
+Kept apart so `pytutils.files` stays importable on interpreters without async generators.
+"""
+
+import time
+
+from .files import _Follower, _expand_path, _make_waiter
+
+
+async def aislurp_follow(
+        filename,
+        mode='r',
+        encoding=None,
+        seek_end=False,
+        idle_timeout=None,
+        use_inotify=True,
+        min_interval=0.01,
+        max_interval=1.0,
+        expanduser=True,
+        expandvars=True,
+):
+    """
+    Asyncio flavor of `pytutils.files.islurp_follow`; an async generator that waits for changes without blocking the
+    event loop.
+
+    Reads themselves are done inline as they only ever read what's already been appended.
+
+    >>> import asyncio, tempfile
+    >>> from pytutils.files import burp
+    >>> async def main(filename):
+    ...     return [line async for line in aislurp_follow(filename, idle_timeout=0.1)]
+    >>> with tempfile.NamedTemporaryFile() as tmp:
+    ...     burp(tmp.name, 'one\\ntwo\\n')
+    ...     asyncio.run(main(tmp.name))
+    ['one\\n', 'two\\n']
+
+    See `pytutils.files.islurp_follow` for parameters.
+    """
+    filename = _expand_path(filename, expanduser=expanduser, expandvars=expandvars)
+
+    follower = _Follower(filename, mode=mode, encoding=encoding, seek_end=seek_end)
+    waiter = _make_waiter(filename, use_inotify=use_inotify, min_interval=min_interval, max_interval=max_interval)
+    try:
+        idle_since = time.time()
+        while True:
+            lines = follower.poll()
+            if lines:
+                for line in lines:
+                    yield line
+                waiter.reset()
+                idle_since = time.time()
+                continue
+
+            timeout = None
+            if idle_timeout is not None:
+                timeout = idle_timeout - (time.time() - idle_since)
+                if timeout <= 0:
+                    return
+            await waiter.async_wait(timeout)
+    finally:
+        follower.close()
+        waiter.close()
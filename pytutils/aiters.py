@@ -0,0 +1,236 @@
+"""
+Asyncio counterparts to `pytutils.iters`.
+
+Everything here accepts async iterables, and plain iterables as a convenience.
+"""
+
+import asyncio
+import functools
+import inspect
+import operator
+
+import wrapt
+
+_sentinel = object()
+
+
+async def _aiter_sync(iterable):
+    for item in iterable:
+        yield item
+
+
+def aiter_(iterable):
+    """
+    Return an async iterator over `iterable`, which may be either an async or a plain iterable.
+
+    >>> async def main():
+    ...     return [x async for x in aiter_([1, 2])]
+    >>> asyncio.run(main())
+    [1, 2]
+    """
+    if hasattr(iterable, '__aiter__'):
+        return iterable.__aiter__()
+    return _aiter_sync(iterable)
+
+
+async def aaccumulate(iterable, func=operator.add):
+    """
+    Iterate over running totals, ie [a,b,c,d] -> func( func( func(a, b), c), d) with each func result yielded.
+    Func is operator.add by default, and may also be a coroutine function.
+
+    >>> async def main():
+    ...     return [x async for x in aaccumulate(aiter_([1, 2, 3, 4, 5]))]
+    >>> asyncio.run(main())
+    [1, 3, 6, 10, 15]
+
+    :param iterable: Async iterable
+    :param func: method (default=operator.add) to call for each pair of (last call result or first item, next item)
+    :return async_generator: Async generator
+    """
+    total = _sentinel
+    async for element in aiter_(iterable):
+        if total is _sentinel:
+            total = element
+        else:
+            total = func(total, element)
+            if inspect.isawaitable(total):
+                total = await total
+        yield total
+
+
+async def aconsume(iterable, n=None, concurrency=None):
+    """
+    Advance an async iterator n-steps ahead. If n is none, consume entirely.
+
+    With `concurrency`, each item is expected to be an awaitable (ie a coroutine) and up to `concurrency` of them are
+    awaited at once; the first exception raised by one is re-raised after the others already running have finished.
+
+    >>> async def work(i, done):
+    ...     done.append(i)
+    >>> async def main():
+    ...     done = []
+    ...     await aconsume((work(i, done) for i in range(10)), concurrency=3)
+    ...     return sorted(done)
+    >>> asyncio.run(main())
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+    >>> async def skip(n):
+    ...     it = aiter_(range(3))
+    ...     await aconsume(it, n)
+    ...     return [i async for i in it]
+    >>> asyncio.run(skip(0)), asyncio.run(skip(2))
+    ([0, 1, 2], [2])
+
+    :param iterable: Async iterable
+    :param int n: Number of items to consume. Everything by default.
+    :param int concurrency: If set, await items, this many at a time.
+    """
+    it = aiter_(iterable)
+    if n is not None and n <= 0:
+        return  # checked up front, as the loops below only check after taking an item
+
+    if not concurrency:
+        count = 0
+        async for _ in it:
+            count += 1
+            if n is not None and count >= n:
+                break
+        return
+
+    pending = set()
+    error = None
+    count = 0
+    try:
+        async for aw in it:
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                error = error or _first_exception(done)
+                if error:
+                    break
+
+            pending.add(asyncio.ensure_future(aw))
+
+            count += 1
+            if n is not None and count >= n:
+                break
+
+        if pending:
+            done, pending = await asyncio.wait(pending)
+            error = error or _first_exception(done)
+    finally:
+        if pending:
+            await asyncio.wait(pending)
+
+    if error:
+        raise error
+
+
+def _first_exception(futures):
+    for future in futures:
+        if not future.cancelled() and future.exception() is not None:
+            return future.exception()
+
+
+async def adedupe_iter(iterable, hashfunc=hash, done=None):
+    """
+    Deduplicates an async iterator iteratively using hashed values in a set, ala `pytutils.iters.dedupe_iter`.
+
+    >>> async def main():
+    ...     return [x async for x in adedupe_iter(aiter_([1, 2, 1, 3, 2]))]
+    >>> asyncio.run(main())
+    [1, 2, 3]
+
+    :param iterable: Async iterable to dedupe
+    :param hashfunc: Func to hash each item with before storing it in `done`
+    :param done: Store of seen hashes; anything supporting `in` and `add`. Defaults to a new `set`.
+    :return async_generator: Async iterator of deduplicated results.
+    """
+    if done is None:
+        done = set()
+
+    async for item in aiter_(iterable):
+        hashed = hashfunc(item)
+
+        if hashed in done:
+            continue
+
+        done.add(hashed)
+        yield item
+
+
+def adedupe(f=None, hashfunc=hash, done_factory=set):
+    """
+    Decorator to dedupe an async generator's output automatically, ala `pytutils.iters.dedupe`.
+
+    >>> @adedupe
+    ... async def gen():
+    ...     for x in [1, 2, 1, 3]:
+    ...         yield x
+    >>> async def main():
+    ...     return [x async for x in gen()]
+    >>> asyncio.run(main())
+    [1, 2, 3]
+
+    :param f: Wrapped async generator function
+    :param hashfunc: Func to hash each item with, see `adedupe_iter`
+    :param done_factory: Callable returning a new store of seen hashes for each call, see `adedupe_iter`
+    :return decorator: Decorator
+    """
+    if f is None:
+        return functools.partial(adedupe, hashfunc=hashfunc, done_factory=done_factory)
+
+    @wrapt.decorator
+    def wrapper(wrapped, instance, args, kwargs):
+        agen = wrapped(*args, **kwargs)
+        return adedupe_iter(agen, hashfunc=hashfunc, done=done_factory())
+
+    return wrapper(f)
+
+
+async def amerge(*iterables, **kwargs):
+    """
+    Merge several async iterables into one, yielding items from each as soon as they arrive.
+
+    Each source is read by its own task, at most `maxsize` items ahead of the consumer.
+    If any source raises, the rest are cancelled and the exception is re-raised.
+
+    >>> async def main():
+    ...     return sorted([x async for x in amerge(aiter_([1, 3]), aiter_([2, 4]))])
+    >>> asyncio.run(main())
+    [1, 2, 3, 4]
+
+    :param iterables: Async iterables
+    :param int maxsize: Bound of the internal queue. Default is 1.
+    :return async_generator: Async generator
+    """
+    maxsize = kwargs.pop('maxsize', 1)
+    if kwargs:
+        raise TypeError('Unexpected kwargs: %r' % kwargs)
+
+    queue = asyncio.Queue(maxsize=maxsize)
+    done = object()
+
+    async def produce(iterable):
+        try:
+            async for item in aiter_(iterable):
+                await queue.put((item, None))
+        except Exception as exc:
+            await queue.put((done, exc))
+        else:
+            await queue.put((done, None))
+
+    tasks = [asyncio.ensure_future(produce(iterable)) for iterable in iterables]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item, exc = await queue.get()
+            if item is done:
+                if exc is not None:
+                    raise exc
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
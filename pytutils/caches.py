@@ -0,0 +1,1023 @@
+"""
+Cache mappings to memoize with, ie as the `cache` for `pytutils.memo.cachedmethod`.
+
+They follow the `cachetools` conventions: `maxsize` bounds the cache, `getsizeof` gives each entry's cost and
+storing a value that can never fit raises `ValueError`.
+"""
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+import collections
+import functools
+import os
+import struct
+import threading
+import time
+
+_sentinel = object()
+
+
+class _Entry(object):
+    __slots__ = ('value', 'cost', 'expires')
+
+    def __init__(self, value, cost, expires):
+        self.value = value
+        self.cost = cost
+        self.expires = expires
+
+
+class LRUPolicy(object):
+    """Evicts the least recently used key."""
+
+    def __init__(self, maxsize):
+        self._order = collections.OrderedDict()
+
+    def hit(self, key):
+        self._order.move_to_end(key)
+
+    def insert(self, key):
+        self._order[key] = None
+
+    def remove(self, key):
+        del self._order[key]
+
+    def victim(self):
+        return next(iter(self._order))
+
+
+class LFUPolicy(object):
+    """Evicts the least frequently used key; ties go to the least recently used one. All operations are O(1)."""
+
+    def __init__(self, maxsize):
+        self._freq = {}
+        self._buckets = {}  # {freq: OrderedDict({key: None})}, only for frequencies in use
+        # Frequencies in use as a doubly linked list from the lowest up, so neither a hit nor picking a victim has to
+        # search for the next one
+        self._lower = {}
+        self._higher = {}
+        self._lowest = None
+        self._newest = _sentinel
+
+    def _add(self, key, freq, lower):
+        # A new bucket goes right above `lower` (None for the bottom), as no frequency in use lies in between
+        bucket = self._buckets.get(freq)
+        if bucket is None:
+            bucket = self._buckets[freq] = collections.OrderedDict()
+            higher = self._lowest if lower is None else self._higher[lower]
+            self._lower[freq], self._higher[freq] = lower, higher
+            if lower is None:
+                self._lowest = freq
+            else:
+                self._higher[lower] = freq
+            if higher is not None:
+                self._lower[higher] = freq
+        bucket[key] = None
+        self._freq[key] = freq
+
+    def _discard(self, key, freq):
+        bucket = self._buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[freq]
+            lower, higher = self._lower.pop(freq), self._higher.pop(freq)
+            if lower is None:
+                self._lowest = higher
+            else:
+                self._higher[lower] = higher
+            if higher is not None:
+                self._lower[higher] = lower
+
+    def hit(self, key):
+        freq = self._freq[key]
+        self._add(key, freq + 1, freq)
+        self._discard(key, freq)
+
+    def insert(self, key):
+        self._add(key, 1, None)
+        self._newest = key
+
+    def remove(self, key):
+        self._discard(key, self._freq.pop(key))
+
+    def victim(self):
+        # Never pick the key that was just inserted unless it's all there is. Only a bucket holding nothing but it is
+        # passed over, so at most two are looked at.
+        freq = self._lowest
+        while freq is not None:
+            for key in self._buckets[freq]:
+                if key != self._newest:
+                    return key
+            freq = self._higher[freq]
+        return self._newest
+
+
+class FrequencySketch(object):
+    """
+    Count-min sketch of 4bit counters, estimating how often each key was seen recently.
+
+    All counters are halved every `sample_size` increments so stale popularity fades away.
+
+    >>> sketch = FrequencySketch(16)
+    >>> for _ in range(3):
+    ...     sketch.increment('a')
+    >>> sketch.estimate('a'), sketch.estimate('b')
+    (3, 0)
+    """
+
+    depth = 4
+    max_count = 15
+
+    def __init__(self, maxsize, sample_factor=10):
+        width = 16
+        while width < maxsize:
+            width <<= 1
+        self._mask = width - 1
+        self._rows = [bytearray(width) for _ in range(self.depth)]
+        self._seeds = (0x9e3779b1, 0x85ebca77, 0xc2b2ae3d, 0x27d4eb2f)
+        self.sample_size = max(1, maxsize * sample_factor)
+        self._additions = 0
+
+    def _indexes(self, key):
+        h = hash(key)
+        mask = self._mask
+        return [((h ^ seed) * seed >> 7) & mask for seed in self._seeds]
+
+    def estimate(self, key):
+        return min(row[i] for row, i in zip(self._rows, self._indexes(key)))
+
+    def increment(self, key):
+        added = False
+        for row, i in zip(self._rows, self._indexes(key)):
+            if row[i] < self.max_count:
+                row[i] += 1
+                added = True
+
+        if added:
+            self._additions += 1
+            if self._additions >= self.sample_size:
+                self._reset()
+
+    def _reset(self):
+        for row in self._rows:
+            for i, count in enumerate(row):
+                row[i] = count >> 1
+        self._additions //= 2
+
+
+class TinyLFUPolicy(object):
+    """
+    W-TinyLFU: a small LRU admission window in front of a segmented LRU main area.
+
+    Keys evicted from the window only stay in the main area if the `FrequencySketch` says they are more popular
+    than the main area's own eviction candidate, which keeps one-hit wonders from flushing out popular keys.
+    """
+
+    def __init__(self, maxsize, window_ratio=0.01, protected_ratio=0.8):
+        self._window_max = max(1, int(maxsize * window_ratio))
+        self._main_max = max(1, maxsize - self._window_max)
+        self._protected_max = max(1, int(self._main_max * protected_ratio))
+
+        self._window = collections.OrderedDict()
+        self._probation = collections.OrderedDict()
+        self._protected = collections.OrderedDict()
+        self._sketch = FrequencySketch(maxsize)
+
+    def hit(self, key):
+        self._sketch.increment(key)
+
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+        else:
+            # Promote from probation, demoting protected's LRU if it's now over its share
+            del self._probation[key]
+            self._protected[key] = None
+            if len(self._protected) > self._protected_max:
+                demoted, _ = self._protected.popitem(last=False)
+                self._probation[demoted] = None
+
+    def insert(self, key):
+        self._sketch.increment(key)
+
+        self._window[key] = None
+        if len(self._window) > self._window_max:
+            # Window overflow goes on probation; `victim` decides whether it gets to stay
+            candidate, _ = self._window.popitem(last=False)
+            self._probation[candidate] = None
+
+    def remove(self, key):
+        for segment in (self._window, self._probation, self._protected):
+            if key in segment:
+                del segment[key]
+                return
+
+    def victim(self):
+        probation, protected = self._probation, self._protected
+
+        if len(probation) + len(protected) > self._main_max and probation:
+            # Duel between the latest arrival from the window and main's own LRU; the loser gets evicted
+            candidate = next(reversed(probation))
+            if len(probation) > 1:
+                victim = next(iter(probation))
+            elif protected:
+                victim = next(iter(protected))
+            else:
+                return candidate
+
+            if self._sketch.estimate(candidate) > self._sketch.estimate(victim):
+                return victim
+            return candidate
+
+        if probation:
+            return next(iter(probation))
+        if protected:
+            return next(iter(protected))
+        return next(iter(self._window))
+
+
+POLICIES = {
+    'lru': LRUPolicy,
+    'lfu': LFUPolicy,
+    'tinylfu': TinyLFUPolicy,
+}
+
+
+class MemoCache(MutableMapping):
+    """
+    Bounded cache mapping with pluggable eviction policy, optional TTL and per entry cost, that keeps stats.
+
+    Drop in for a `cachetools` cache, ie as what `cache(self)` returns for `pytutils.memo.cachedmethod`.
+
+    >>> cache = MemoCache(maxsize=2, policy='lru')
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache['a']
+    1
+    >>> cache['c'] = 3  # evicts 'b', the least recently used
+    >>> sorted(cache)
+    ['a', 'c']
+    >>> cache.stats()
+    {'hits': 1, 'misses': 0, 'evictions': 1, 'expirations': 0, 'size': 2, 'cost': 2, 'hit_ratio': 1.0}
+
+    Costs, ie byte sizes:
+
+    >>> cache = MemoCache(maxsize=100, maxcost=10, getsizeof=len)
+    >>> cache['a'] = 'x' * 6
+    >>> cache['b'] = 'x' * 6  # evicts 'a' to make room
+    >>> list(cache), cache.currcost
+    (['b'], 6)
+    >>> cache['c'] = 'x' * 11
+    Traceback (most recent call last):
+        ...
+    ValueError: value too large
+    """
+
+    def __init__(self, maxsize=1024, policy='lru', ttl=None, maxcost=None, getsizeof=None, timer=time.monotonic):
+        """
+        :param int maxsize: Maximum number of entries.
+        :param str|type policy: Eviction policy; `lru`, `lfu`, `tinylfu` or a class implementing the same interface.
+        :param float ttl: If set, entries expire this many seconds after being stored.
+        :param int maxcost: If set, maximum total cost of all entries.
+        :param callable getsizeof: Returns the cost of a value, ie `sys.getsizeof` or `len`. Each entry costs 1 by
+                                   default.
+        :param callable timer: Clock used for TTLs.
+        """
+        if isinstance(policy, str):
+            policy = POLICIES[policy]
+
+        self.maxsize = maxsize
+        self.maxcost = maxcost
+        self.ttl = ttl
+        self.timer = timer
+        self._getsizeof = getsizeof
+
+        self._policy = policy(maxsize)
+        self._data = {}
+        # Entries ordered by when they expire, which for a fixed TTL is insertion order
+        self._expiry = collections.OrderedDict() if ttl is not None else None
+
+        self.currcost = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __repr__(self):
+        return '%s(maxsize=%r, currsize=%r, policy=%s)' % (
+            self.__class__.__name__, self.maxsize, len(self._data), self._policy.__class__.__name__
+        )
+
+    def getsizeof(self, value):
+        if self._getsizeof is None:
+            return 1
+        return self._getsizeof(value)
+
+    @property
+    def currsize(self):
+        return len(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(list(self._data))
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and not self._expired(entry)
+
+    def _expired(self, entry):
+        return entry.expires is not None and entry.expires <= self.timer()
+
+    def __getitem__(self, key):
+        entry = self._data.get(key)
+        if entry is not None and self._expired(entry):
+            self._delete(key)
+            self.expirations += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return self.__missing__(key)
+
+        self.hits += 1
+        self._policy.hit(key)
+        return entry.value
+
+    def __missing__(self, key):
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        cost = self.getsizeof(value)
+        if self.maxcost is not None and cost > self.maxcost:
+            raise ValueError('value too large')
+
+        if key in self._data:
+            self._delete(key)
+        self.expire()
+
+        expires = None
+        if self.ttl is not None:
+            expires = self.timer() + self.ttl
+            self._expiry[key] = None
+
+        self._data[key] = _Entry(value, cost, expires)
+        self.currcost += cost
+        self._policy.insert(key)
+
+        # Evict after inserting, so admission policies get to weigh the new key against the old ones.
+        # That can mean the new key itself is rejected right away.
+        while len(self._data) > self.maxsize or (self.maxcost is not None and self.currcost > self.maxcost):
+            self._delete(self._policy.victim())
+            self.evictions += 1
+
+    def __delitem__(self, key):
+        if key not in self._data:
+            raise KeyError(key)
+        self._delete(key)
+
+    def _delete(self, key):
+        entry = self._data.pop(key)
+        self.currcost -= entry.cost
+        self._policy.remove(key)
+        if self._expiry is not None:
+            self._expiry.pop(key, None)
+
+    def expire(self):
+        """Remove expired entries, oldest first."""
+        if self._expiry is None:
+            return
+
+        now = self.timer()
+        while self._expiry:
+            key = next(iter(self._expiry))
+            if self._data[key].expires > now:
+                break
+            self._delete(key)
+            self.expirations += 1
+
+    def clear(self):
+        for key in list(self._data):
+            self._delete(key)
+
+    def stats(self):
+        """
+        Snapshot of counters.
+
+        :return dict: hits, misses, evictions, expirations, size, cost and hit_ratio
+        """
+        lookups = self.hits + self.misses
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            size=len(self._data),
+            cost=self.currcost,
+            hit_ratio=self.hits / float(lookups) if lookups else 0.0,
+        )
+
+
+class DiskCache(MutableMapping):
+    """
+    Persistent cache mapping in an SQLite database (in WAL mode), safe to share between processes on one host.
+
+    Survives restarts, so memoized results do not have to be recomputed after each one. Keys are pickled with
+    `pytutils.sets.canonical_dumps`, and values are pickled (or serialized with `serializer`). Entries are evicted by `ttl`, and once over `maxsize` entries or `maxbytes` of
+    values, least recently used first. Bounds are enforced every `cull_interval` writes, so they can briefly be
+    exceeded.
+
+    Reads can be fronted by a per-process in-memory cache of `memory_maxsize` entries, which `warm` preloads with
+    the most used entries; `warm_size` does that right away. Entries are served from it until they expire, for at
+    most `memory_ttl` seconds, so changes made by other processes show up within that.
+
+    >>> import os, tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'memo.sqlite')
+    >>> cache = DiskCache(path, maxsize=1000)
+    >>> cache[('square', 3)] = 9
+    >>> cache.close()
+    >>> DiskCache(path)[('square', 3)]
+    9
+
+    Instances can be shared between threads, in-memory front included:
+
+    >>> import sys
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> shared = DiskCache(os.path.join(tempfile.mkdtemp(), 'memo.sqlite'), memory_maxsize=8, memory_ttl=0.0005)
+    >>> def churn(seed):
+    ...     for i in range(500):
+    ...         shared[(seed + i) % 64] = (seed + i) % 64
+    ...         assert shared[(seed + i) % 64] == (seed + i) % 64
+    >>> interval = sys.getswitchinterval()
+    >>> sys.setswitchinterval(1e-6)  # switch threads as often as possible to shake out races
+    >>> with ThreadPoolExecutor(8) as executor:
+    ...     list(executor.map(churn, range(8)))
+    [None, None, None, None, None, None, None, None]
+    >>> sys.setswitchinterval(interval)
+    >>> shared[7] = 'still usable'
+    >>> shared[7]
+    'still usable'
+
+    Note `pytutils.memo.cachedmethod`'s default key includes `self`; give it a `key` without it so entries can be found
+    again by other instances and processes.
+    """
+
+    # Run eviction every this many writes, rather than counting rows on each one
+    cull_interval = 64
+    # Flush recorded hits to disk every this many reads
+    hits_flush_interval = 256
+
+    def __init__(
+            self,
+            path,
+            maxsize=None,
+            maxbytes=None,
+            ttl=None,
+            serializer=None,
+            memory_maxsize=None,
+            warm_size=0,
+            timeout=30,
+            timer=time.time,
+            memory_ttl=1.0,
+    ):
+        """
+        :param str path: SQLite database file, created if it does not exist
+        :param int maxsize: Maximum number of entries
+        :param int maxbytes: Maximum total size of serialized values
+        :param float ttl: If set, entries expire this many seconds after being stored
+        :param serializer: Module or object with `dumps`/`loads`, ie `pickle` (default) or `msgpack`
+        :param int memory_maxsize: If set, front reads with an in-memory LRU `MemoCache` of this many entries
+        :param int warm_size: Preload this many of the most used entries into the in-memory cache at startup
+        :param float timeout: Seconds to wait on other processes holding the database lock
+        :param callable timer: Wall clock used for TTLs; shared across processes, so not monotonic
+        :param float memory_ttl: Seconds entries can be served from the in-memory cache without checking the disk
+        """
+        import pickle
+        from .sets import canonical_dumps
+
+        self.path = path
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.timeout = timeout
+        self.timer = timer
+        self.memory_ttl = memory_ttl
+        # Entries removed by `cull` to stay within `maxsize`/`maxbytes`, by this instance
+        self.evictions = 0
+        self._serializer = serializer or pickle
+        # Rows are looked up by these bytes, so equal keys must give equal bytes
+        self._dumps_key = functools.partial(canonical_dumps, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._pending_hits = collections.Counter()
+
+        # `MemoCache` is not thread-safe, so every use of the in-memory front goes through this
+        self._memory_lock = threading.Lock()
+        self._memory = None
+        if memory_maxsize:
+            self._memory = self._make_memory(memory_maxsize)
+
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                ' key BLOB PRIMARY KEY,'
+                ' value BLOB NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' expires REAL,'
+                ' hits INTEGER NOT NULL DEFAULT 0,'
+                ' accessed REAL NOT NULL'
+                ')'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+
+        if warm_size:
+            self.warm(warm_size)
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.path)
+
+    def _connect(self):
+        """Connection for this thread (and process; sqlite connections must not cross a fork)."""
+        import sqlite3
+
+        local = self._local
+        pid = os.getpid()
+        if getattr(local, 'pid', None) != pid:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            local.conn, local.pid = conn, pid
+        return local.conn
+
+    def _loads(self, blob):
+        return self._serializer.loads(blob)
+
+    def _make_memory(self, maxsize):
+        # Holds (value, expires on disk); its own TTL bounds how stale entries can get
+        return MemoCache(maxsize=maxsize, ttl=self.memory_ttl, timer=self.timer)
+
+    def __getitem__(self, key):
+        if self._memory is not None:
+            with self._memory_lock:
+                entry = self._memory.get(key)
+                if entry is not None and entry[1] is not None and entry[1] <= self.timer():
+                    del self._memory[key]
+                    entry = None
+            if entry is not None:
+                return entry[0]
+
+        kblob = self._dumps_key(key)
+        row = self._connect().execute('SELECT value, expires FROM cache WHERE key = ?', (kblob, )).fetchone()
+        if row is None:
+            raise KeyError(key)
+
+        vblob, expires = row
+        if expires is not None and expires <= self.timer():
+            self._connect().execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (kblob, self.timer()))
+            raise KeyError(key)
+
+        value = self._loads(vblob)
+        self._record_hit(kblob)
+
+        if self._memory is not None:
+            with self._memory_lock:
+                self._memory[key] = (value, expires)
+        return value
+
+    def _record_hit(self, kblob):
+        with self._lock:
+            self._pending_hits[kblob] += 1
+            flush = len(self._pending_hits) >= self.hits_flush_interval
+        if flush:
+            self.flush_hits()
+
+    def flush_hits(self):
+        """Write recorded hits (and access times, which LRU eviction goes by) to disk."""
+        with self._lock:
+            pending, self._pending_hits = self._pending_hits, collections.Counter()
+        if not pending:
+            return
+
+        now = self.timer()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN')
+            conn.executemany(
+                'UPDATE cache SET hits = hits + ?, accessed = ? WHERE key = ?',
+                [(count, now, kblob) for kblob, count in pending.items()],
+            )
+
+    def __setitem__(self, key, value):
+        vblob = self._serializer.dumps(value)
+        size = len(vblob)
+        if self.maxbytes is not None and size > self.maxbytes:
+            raise ValueError('value too large')
+
+        now = self.timer()
+        expires = now + self.ttl if self.ttl is not None else None
+        self._connect().execute(
+            'INSERT OR REPLACE INTO cache (key, value, size, expires, hits, accessed) VALUES (?, ?, ?, ?, 0, ?)',
+            (self._dumps_key(key), vblob, size, expires, now),
+        )
+
+        if self._memory is not None:
+            with self._memory_lock:
+                self._memory[key] = (value, expires)
+
+        with self._lock:
+            self._writes += 1
+            cull = self._writes % self.cull_interval == 0
+        if cull or self.maxsize is not None and self.maxsize < self.cull_interval:
+            self.cull()
+
+    def __delitem__(self, key):
+        if self._memory is not None:
+            with self._memory_lock:
+                self._memory.pop(key, None)
+
+        cursor = self._connect().execute('DELETE FROM cache WHERE key = ?', (self._dumps_key(key), ))
+        if not cursor.rowcount:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        row = self._connect().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._dumps_key(key), self.timer()),
+        ).fetchone()
+        return row is not None
+
+    def __iter__(self):
+        import pickle
+
+        rows = self._connect().execute(
+            'SELECT key FROM cache WHERE expires IS NULL OR expires > ?', (self.timer(), )
+        ).fetchall()
+        return (pickle.loads(kblob) for kblob, in rows)
+
+    def __len__(self):
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM cache WHERE expires IS NULL OR expires > ?', (self.timer(), )
+        ).fetchone()[0]
+
+    def cull(self):
+        """Remove expired entries, then least recently used ones until within `maxsize` and `maxbytes`."""
+        self.flush_hits()
+
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM cache WHERE expires <= ?', (self.timer(), ))
+            evicted = 0
+
+            if self.maxsize is not None:
+                count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+                if count > self.maxsize:
+                    cursor = conn.execute(
+                        'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                        (count - self.maxsize, ),
+                    )
+                    evicted += cursor.rowcount
+
+            if self.maxbytes is not None:
+                total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+                if total > self.maxbytes:
+                    # Walk from the least recently used end until enough has been freed
+                    excess, doomed = total - self.maxbytes, []
+                    for kblob, size in conn.execute('SELECT key, size FROM cache ORDER BY accessed'):
+                        doomed.append((kblob, ))
+                        excess -= size
+                        if excess <= 0:
+                            break
+                    evicted += conn.executemany('DELETE FROM cache WHERE key = ?', doomed).rowcount
+
+        with self._lock:
+            self.evictions += evicted
+
+    def warm(self, count):
+        """
+        Load the `count` most used entries into the in-memory cache.
+
+        :return int: Number of entries loaded
+        """
+        import pickle
+
+        rows = self._connect().execute(
+            'SELECT key, value, expires FROM cache WHERE expires IS NULL OR expires > ? ORDER BY hits DESC LIMIT ?',
+            (self.timer(), count),
+        ).fetchall()
+        # Least used first, so the hottest end up most recently used
+        entries = [(pickle.loads(kblob), (self._loads(vblob), expires)) for kblob, vblob, expires in reversed(rows)]
+
+        with self._memory_lock:
+            if self._memory is None:
+                self._memory = self._make_memory(max(count, 1))
+            for key, entry in entries:
+                self._memory[key] = entry
+        return len(rows)
+
+    def clear(self):
+        if self._memory is not None:
+            with self._memory_lock:
+                self._memory.clear()
+        self._connect().execute('DELETE FROM cache')
+
+    def close(self):
+        """Flush recorded hits and close this thread's connection."""
+        self.flush_hits()
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.pid = self._local.conn = None
+
+
+class SharedMemoryCache(MutableMapping):
+    """
+    LRU/TTL cache mapping in a fixed size slab of `multiprocessing.shared_memory`, shared by every process it's handed
+    to; ie by all workers of a pre-fork server when created before forking.
+
+    The slab is a set associative table: each key hashes (with `pytutils.sets.stable_hash`, so the same in every
+    process) to a bucket of `ways` slots of `slot_size` bytes, and evicts the least recently used of them when full.
+    Keys are pickled with `pytutils.sets.canonical_dumps`, so equal keys find the same entry, and values are pickled
+    (or serialized with `serializer`); storing an entry that does not fit in a slot raises
+    `ValueError`, which `pytutils.memo.cachedmethod` takes as "do not cache". Buckets are guarded by `num_locks`
+    striped locks, and (de)serialization happens outside of them.
+
+    Forked children reattach to the slab by name on first use, ala `pytutils.mappings.ProcessLocal`; for spawned
+    processes pass it as `multiprocessing.Process` args or a `Pool` initializer. The creating process should `unlink`
+    it once everyone is done.
+
+    >>> cache = SharedMemoryCache(maxsize=64, slot_size=256)
+    >>> cache[('square', 3)] = 9
+    >>> cache[('square', 3)], ('square', 4) in cache, len(cache)
+    (9, False, 1)
+    >>> cache._handle_pid(new_pid=-1)  # Emulate a fork
+    >>> cache[('square', 3)]
+    9
+    >>> x = 'ab'
+    >>> cache[(x, x)] = 1
+    >>> cache.get((x, ''.join(['a', 'b'])))
+    1
+    >>> cache.unlink()
+
+    Note `pytutils.memo.cachedmethod`'s default key includes `self`; give it a `key` without it so entries can be found
+    again by other instances and processes.
+    """
+
+    # fingerprint (0 when empty), expires (0 for never), last accessed, key length, value length
+    _header = struct.Struct('<QddII')
+
+    def __init__(
+            self,
+            maxsize=4096,
+            slot_size=1024,
+            ways=8,
+            ttl=None,
+            serializer=None,
+            num_locks=64,
+            name=None,
+            locks=None,
+            context=None,
+            timer=time.time,
+    ):
+        """
+        :param int maxsize: Number of entries to make room for; the slab takes `maxsize * slot_size` bytes.
+        :param int slot_size: Bytes per entry, including its serialized key and a 32 byte header.
+        :param int ways: Slots per bucket; higher gets closer to true LRU at the cost of longer scans.
+        :param float ttl: If set, entries expire this many seconds after being stored
+        :param serializer: Module or object with `dumps`/`loads` for values, ie `pickle` (default) or `msgpack`
+        :param int num_locks: Number of locks buckets are striped over
+        :param str name: Shared memory block name to attach to. A new block is created if not given.
+        :param list locks: `multiprocessing.Lock`s to use when attaching, one per stripe.
+        :param multiprocessing.context.BaseContext context: Context to create locks with, ie
+                                                            `multiprocessing.get_context('spawn')`.
+        :param callable timer: Wall clock used for TTLs and recency; shared across processes, so not monotonic
+        """
+        import multiprocessing
+        import pickle
+        from multiprocessing import shared_memory
+
+        if slot_size <= self._header.size:
+            raise ValueError('slot_size must be larger than %d' % self._header.size)
+
+        self.ways = ways
+        self.num_buckets = max(1, -(-maxsize // ways))
+        self.maxsize = self.num_buckets * ways
+        self.slot_size = slot_size
+        self.ttl = ttl
+        self.num_locks = min(num_locks, self.num_buckets)
+        self.timer = timer
+        # As passed, to pickle for attaching; serializers need not be modules with a `__name__`
+        self._serializer_arg = serializer
+        self._serializer = serializer or pickle
+
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=self.maxsize * slot_size)
+            self._owner = True
+            context = context or multiprocessing
+            locks = [context.Lock() for _ in range(self.num_locks)]
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+            if locks is None:
+                raise ValueError('Attaching to an existing SharedMemoryCache requires its locks.')
+
+        self.name = self._shm.name
+        self._locks = locks
+        self._pid = os.getpid()
+
+    def __getstate__(self):
+        return dict(
+            maxsize=self.maxsize,
+            slot_size=self.slot_size,
+            ways=self.ways,
+            ttl=self.ttl,
+            serializer=self._serializer_arg,
+            num_locks=self.num_locks,
+            name=self.name,
+            locks=self._locks,
+            timer=self.timer,
+        )
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __repr__(self):
+        return '<%s name=%r maxsize=%d slot_size=%d>' % (
+            self.__class__.__name__, self.name, self.maxsize, self.slot_size
+        )
+
+    def _handle_pid(self, new_pid=os.getpid):
+        """Reattach to the slab if the current PID changed, ie after a fork."""
+        if callable(new_pid):
+            new_pid = new_pid()
+
+        if self._pid != new_pid:
+            from multiprocessing import shared_memory
+
+            self._shm = shared_memory.SharedMemory(name=self.name)
+            self._owner = False
+            self._pid = new_pid
+
+    def _dumps_key(self, key):
+        import pickle
+        from .sets import canonical_dumps
+
+        if isinstance(key, tuple) and type(key) is not tuple:
+            key = tuple(key)  # ie `cachetools.keys.hashkey`s, so they match plain tuples from other callers
+        # Slots are matched on these bytes, so equal keys must give equal bytes
+        return canonical_dumps(key, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _locate(self, kblob):
+        from .sets import stable_hash
+
+        fingerprint = stable_hash(kblob) or 1  # 0 marks an empty slot
+        bucket = fingerprint % self.num_buckets
+        return fingerprint, bucket, self._locks[bucket % self.num_locks]
+
+    def _find(self, buf, fingerprint, bucket, kblob):
+        """Return (slot offset, header) of `kblob`, or (None, None). Call with the bucket locked."""
+        header = self._header
+        base = bucket * self.ways * self.slot_size
+        for way in range(self.ways):
+            offset = base + way * self.slot_size
+            fields = header.unpack_from(buf, offset)
+            if fields[0] == fingerprint:
+                start = offset + header.size
+                if buf[start:start + fields[3]] == kblob:
+                    return offset, fields
+        return None, None
+
+    def __getitem__(self, key):
+        self._handle_pid()
+        kblob = self._dumps_key(key)
+        fingerprint, bucket, lock = self._locate(kblob)
+        buf = self._shm.buf
+        header = self._header
+
+        with lock:
+            offset, fields = self._find(buf, fingerprint, bucket, kblob)
+            if offset is None:
+                raise KeyError(key)
+
+            _, expires, _, klen, vlen = fields
+            now = self.timer()
+            if expires and expires <= now:
+                header.pack_into(buf, offset, 0, 0.0, 0.0, 0, 0)
+                raise KeyError(key)
+
+            header.pack_into(buf, offset, fingerprint, expires, now, klen, vlen)
+            start = offset + header.size + klen
+            vblob = bytes(buf[start:start + vlen])
+
+        return self._serializer.loads(vblob)
+
+    def __setitem__(self, key, value):
+        self._handle_pid()
+        kblob = self._dumps_key(key)
+        vblob = self._serializer.dumps(value)
+        if self._header.size + len(kblob) + len(vblob) > self.slot_size:
+            raise ValueError('value too large')
+
+        fingerprint, bucket, lock = self._locate(kblob)
+        buf = self._shm.buf
+        header = self._header
+        now = self.timer()
+        expires = now + self.ttl if self.ttl is not None else 0.0
+
+        with lock:
+            offset, _ = self._find(buf, fingerprint, bucket, kblob)
+            if offset is None:
+                offset = self._victim(buf, bucket, now)
+
+            start = offset + header.size
+            buf[start:start + len(kblob)] = kblob
+            start += len(kblob)
+            buf[start:start + len(vblob)] = vblob
+            header.pack_into(buf, offset, fingerprint, expires, now, len(kblob), len(vblob))
+
+    def _victim(self, buf, bucket, now):
+        """Offset of an empty or expired slot in `bucket`, else its least recently used one."""
+        header = self._header
+        base = bucket * self.ways * self.slot_size
+        victim, oldest = None, None
+        for way in range(self.ways):
+            offset = base + way * self.slot_size
+            fingerprint, expires, accessed, _, _ = header.unpack_from(buf, offset)
+            if not fingerprint or expires and expires <= now:
+                return offset
+            if oldest is None or accessed < oldest:
+                victim, oldest = offset, accessed
+        return victim
+
+    def __delitem__(self, key):
+        self._handle_pid()
+        kblob = self._dumps_key(key)
+        fingerprint, bucket, lock = self._locate(kblob)
+        buf = self._shm.buf
+
+        with lock:
+            offset, fields = self._find(buf, fingerprint, bucket, kblob)
+            if offset is None:
+                raise KeyError(key)
+            self._header.pack_into(buf, offset, 0, 0.0, 0.0, 0, 0)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def _live_slots(self):
+        """Yield (offset, header) of every live slot; a lock free snapshot, so approximate under concurrent writes."""
+        self._handle_pid()
+        buf = self._shm.buf
+        header = self._header
+        now = self.timer()
+        for offset in range(0, self.maxsize * self.slot_size, self.slot_size):
+            fields = header.unpack_from(buf, offset)
+            if fields[0] and not (fields[1] and fields[1] <= now):
+                yield offset, fields
+
+    def __iter__(self):
+        import pickle
+
+        buf = self._shm.buf
+        start = self._header.size
+        keys = [bytes(buf[offset + start:offset + start + fields[3]]) for offset, fields in self._live_slots()]
+        return (pickle.loads(kblob) for kblob in keys)
+
+    def __len__(self):
+        return sum(1 for _ in self._live_slots())
+
+    def clear(self):
+        self._handle_pid()
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            buf = self._shm.buf
+            for offset in range(0, self.maxsize * self.slot_size, self.slot_size):
+                self._header.pack_into(buf, offset, 0, 0.0, 0.0, 0, 0)
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    def close(self):
+        """Detach from the shared memory block in this process."""
+        self._shm.close()
+
+    def unlink(self):
+        """Detach and destroy the shared memory block; call once from the creating process."""
+        self.close()
+        self._shm.unlink()
@@ -2,48 +2,242 @@
 Utilities to work with files.
 """
 
+import binascii
+import collections
+import contextlib
+import io
+import locale
 import os
 import sys
 import functools
+import mmap
+import stat
+import struct
+import time
+
+import six
+
+from .iters import parallel_map, prefetch
 
 LINEMODE = 0
 
+# Default chunk size for the zero-copy readers.
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+def _expand_path(filename, expanduser=True, expandvars=True):
+    if expanduser:
+        filename = os.path.expanduser(filename)
+    if expandvars:
+        filename = os.path.expandvars(filename)
+    return filename
+
+
+def _binary_stdin():
+    # py3 text streams hide the underlying binary buffer
+    return getattr(sys.stdin, 'buffer', sys.stdin)
+
+
+# Default buffer size between files and (de)compressors.
+DEFAULT_BLOCK_SIZE = 128 * 1024
+
+
+def _open_gzip(fh, mode, compresslevel=None):
+    import gzip
+    return gzip.GzipFile(fileobj=fh, mode=mode, compresslevel=9 if compresslevel is None else compresslevel)
+
+
+def _open_bz2(fh, mode, compresslevel=None):
+    import bz2
+    # compresslevel is also the block size, in units of 100k
+    return bz2.BZ2File(fh, mode=mode, compresslevel=9 if compresslevel is None else compresslevel)
+
+
+def _open_xz(fh, mode, compresslevel=None):
+    import lzma
+    if 'r' in mode:
+        return lzma.LZMAFile(fh, mode=mode)
+    return lzma.LZMAFile(fh, mode=mode, preset=compresslevel)
+
+
+def _open_zstd(fh, mode, compresslevel=None):
+    # Optional dependency
+    import zstandard
+    if 'r' in mode:
+        return zstandard.ZstdDecompressor().stream_reader(fh, closefd=False)
+    cctx = zstandard.ZstdCompressor(level=3 if compresslevel is None else compresslevel)
+    return cctx.stream_writer(fh, closefd=False)
+
+
+# Mapping of {codec: (extensions, magic bytes, opener)}.
+# Openers wrap an already open binary file object, leaving it open when they are closed.
+COMPRESSION_CODECS = collections.OrderedDict([
+    ('gzip', (('.gz', '.gzip'), b'\x1f\x8b', _open_gzip)),
+    ('bz2', (('.bz2', ), b'BZh', _open_bz2)),
+    ('xz', (('.xz', '.lzma'), b'\xfd7zXZ\x00', _open_xz)),
+    ('zstd', (('.zst', '.zstd'), b'\x28\xb5\x2f\xfd', _open_zstd)),
+])
+
+_MAGIC_LEN = max(len(magic) for _, magic, _ in COMPRESSION_CODECS.values())
+
+
+def detect_compression(filename=None, head=None):
+    """
+    Detect compression codec by `filename` extension, falling back to the magic bytes in `head`.
+
+    >>> detect_compression('logs/today.log.gz')
+    'gzip'
+    >>> detect_compression('today.log', head=b'BZh91AY')
+    'bz2'
+    >>> detect_compression('today.log', head=b'hello') is None
+    True
+
+    :param str filename: File path
+    :param bytes head: First few bytes of the file
+    :return str|None: Codec name in `COMPRESSION_CODECS` or None if uncompressed
+    """
+    if filename:
+        lowered = filename.lower()
+        for codec, (extensions, _, _) in COMPRESSION_CODECS.items():
+            if lowered.endswith(extensions):
+                return codec
+
+    if head:
+        for codec, (_, magic, _) in COMPRESSION_CODECS.items():
+            if head.startswith(magic):
+                return codec
+
+
+def _resolve_compression(compression, filename=None, head=None):
+    if compression == 'auto':
+        return detect_compression(filename=filename, head=head)
+    if compression not in COMPRESSION_CODECS:
+        raise ValueError('Unknown compression codec: %r' % compression)
+    return compression
+
+
+def _peek(fh):
+    peek = getattr(fh, 'peek', None)
+    if peek is None:
+        return None
+    return peek(_MAGIC_LEN)[:_MAGIC_LEN]
+
 
-def islurp(filename, mode='r', iter_by=LINEMODE, allow_stdin=True, expanduser=True, expandvars=True):
+def _open_codec(fh, codec, mode, compresslevel=None, block_size=DEFAULT_BLOCK_SIZE):
+    """Wrap binary `fh` with `codec`, buffering by `block_size` and decoding text if `mode` isn't binary."""
+    opener = COMPRESSION_CODECS[codec][2]
+
+    writing = any(c in mode for c in 'wax')
+    binary_mode = (mode[0] if writing else 'r') + 'b'
+
+    stream = opener(fh, binary_mode, compresslevel=compresslevel)
+    if writing:
+        stream = io.BufferedWriter(stream, buffer_size=block_size)
+    else:
+        stream = io.BufferedReader(stream, buffer_size=block_size)
+
+    if 'b' not in mode:
+        stream = io.TextIOWrapper(stream)
+    return stream
+
+
+def islurp(
+        filename,
+        mode='r',
+        iter_by=LINEMODE,
+        allow_stdin=True,
+        expanduser=True,
+        expandvars=True,
+        compression='auto',
+        block_size=DEFAULT_BLOCK_SIZE,
+        readahead=0,
+):
     """
     Read [expanded] `filename` and yield each (line | chunk).
 
+    Compressed files are decompressed on the fly, in bounded memory. The codec is detected by extension or magic
+    bytes; see `COMPRESSION_CODECS`.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile(suffix='.gz') as tmp:
+    ...     burp(tmp.name, 'one\\ntwo\\n')
+    ...     list(islurp(tmp.name))
+    ['one\\n', 'two\\n']
+
     :param str filename: File path
     :param str mode: Use this mode to open `filename`, ala `r` for text (default), `rb` for binary, etc.
     :param int iter_by: Iterate by this many bytes at a time. Default is by line.
     :param bool allow_stdin: If Truthy and filename is `-`, read from `sys.stdin`.
     :param bool expanduser: If Truthy, expand `~` in `filename`
     :param bool expandvars: If Truthy, expand env vars in `filename`
+    :param str compression: Codec name, `auto` to detect it (default), or None to read the file as is.
+    :param int block_size: Buffer size used between the file and the decompressor.
+    :param int readahead: If set, decompress/read up to this many (lines | chunks) ahead in a background thread.
+    :return generator: Generator of (lines | chunks).
     """
     if iter_by == 'LINEMODE':
         iter_by = LINEMODE
 
+    gen = _islurp(
+        filename,
+        mode=mode,
+        iter_by=iter_by,
+        allow_stdin=allow_stdin,
+        expanduser=expanduser,
+        expandvars=expandvars,
+        compression=compression,
+        block_size=block_size,
+    )
+    if readahead:
+        gen = prefetch(gen, readahead)
+    return gen
+
+
+def _islurp(filename, mode, iter_by, allow_stdin, expanduser, expandvars, compression, block_size):
     fh = None
+    owned = []  # streams we opened and need to close, outermost first
     try:
         if filename == '-' and allow_stdin:
             fh = sys.stdin
+            if 'b' in mode:
+                fh = _binary_stdin()
+
+            if compression:
+                raw = _binary_stdin()
+                codec = _resolve_compression(compression, head=_peek(raw))
+                if codec:
+                    fh = _open_codec(raw, codec, mode, block_size=block_size)
+                    owned.append(fh)
         else:
-            if expanduser:
-                filename = os.path.expanduser(filename)
-            if expandvars:
-                filename = os.path.expandvars(filename)
+            filename = _expand_path(filename, expanduser=expanduser, expandvars=expandvars)
+
+            if compression:
+                raw = open(filename, 'rb')
+                owned.append(raw)
 
-            fh = open(filename, mode)
-            fh_next = fh.readline if iter_by == LINEMODE else functools.partial(fh.read, iter_by)
+                codec = _resolve_compression(compression, filename=filename, head=_peek(raw))
+                if codec:
+                    fh = _open_codec(raw, codec, mode, block_size=block_size)
+                elif 'b' in mode:
+                    fh = raw
+                else:
+                    fh = io.TextIOWrapper(raw)
+                owned.insert(0, fh)
+            else:
+                fh = open(filename, mode)
+                owned.append(fh)
+
+        fh_next = fh.readline if iter_by == LINEMODE else functools.partial(fh.read, iter_by)
 
         while True:
             buf = fh_next()
-            if buf == '':  # EOF
+            if not buf:  # EOF, either '' or b''
                 break
             yield buf
     finally:
-        if fh and fh != sys.stdin:
-            fh.close()
+        for stream in owned:
+            stream.close()
+
 
 # convenience
 islurp.LINEMODE = LINEMODE
@@ -52,17 +246,781 @@ islurp.LINEMODE = LINEMODE
 slurp = islurp
 
 
-def burp(filename, contents, mode='w', allow_stdout=True, expanduser=True, expandvars=True):
+def islurp_into(filename, iter_by=DEFAULT_CHUNK_SIZE, buf=None, allow_stdin=True, expanduser=True, expandvars=True):
+    """
+    Read [expanded] `filename` in binary chunks without allocating a new object per chunk.
+
+    Each chunk is read with `readinto` into a single reused buffer and yielded as a `memoryview` slice of it.
+    The view is only valid until the next iteration; copy it (`bytes(chunk)`) if you need to keep it around.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile() as tmp:
+    ...     _ = tmp.write(b'abcdefg')
+    ...     tmp.flush()
+    ...     [bytes(chunk) for chunk in islurp_into(tmp.name, iter_by=3)]
+    [b'abc', b'def', b'g']
+
+    :param str filename: File path
+    :param int iter_by: Read this many bytes at a time. Ignored if `buf` is given.
+    :param bytearray buf: Writable buffer to reuse. Allocated for you by default.
+    :param bool allow_stdin: If Truthy and filename is `-`, read from `sys.stdin`.
+    :param bool expanduser: If Truthy, expand `~` in `filename`
+    :param bool expandvars: If Truthy, expand env vars in `filename`
+    :return generator: Generator of `memoryview` chunks.
+    """
+    if buf is None:
+        buf = bytearray(iter_by)
+    view = memoryview(buf)
+
+    fh = None
+    try:
+        if filename == '-' and allow_stdin:
+            fh = _binary_stdin()
+        else:
+            filename = _expand_path(filename, expanduser=expanduser, expandvars=expandvars)
+            # Unbuffered so `readinto` lands straight in our buffer instead of being copied out of another one
+            fh = open(filename, 'rb', buffering=0)
+
+        while True:
+            count = fh.readinto(view)
+            if not count:  # EOF
+                break
+            yield view[:count]
+    finally:
+        if fh and fh is not _binary_stdin():
+            fh.close()
+
+
+def islurp_mmap(
+        filename, delimiter=b'\n', record_size=None, allow_stdin=True, expanduser=True, expandvars=True
+):
+    """
+    Memory map [expanded] `filename` and yield each (line | record) as a `memoryview` slice of the map.
+
+    No data is copied; the OS pages the file in as the slices are touched. Lines keep their trailing `delimiter`,
+    same as `islurp` does.
+
+    If `filename` is `-` and stdin cannot be mapped (ie it's a pipe), falls back to reading it line by line.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile() as tmp:
+    ...     _ = tmp.write(b'one\\ntwo\\nthree')
+    ...     tmp.flush()
+    ...     [bytes(line) for line in islurp_mmap(tmp.name)]
+    [b'one\\n', b'two\\n', b'three']
+
+    :param str filename: File path
+    :param bytes delimiter: Record delimiter. Default is by line.
+    :param int record_size: If set, yield fixed size records of this many bytes instead of splitting on `delimiter`.
+    :param bool allow_stdin: If Truthy and filename is `-`, read from `sys.stdin`.
+    :param bool expanduser: If Truthy, expand `~` in `filename`
+    :param bool expandvars: If Truthy, expand env vars in `filename`
+    :return generator: Generator of `memoryview` records.
+    """
+    fh = None
+    mm = None
+    try:
+        if filename == '-' and allow_stdin:
+            fh = _binary_stdin()
+        else:
+            filename = _expand_path(filename, expanduser=expanduser, expandvars=expandvars)
+            fh = open(filename, 'rb')
+
+        try:
+            st = os.fstat(fh.fileno())
+            if not stat.S_ISREG(st.st_mode):
+                raise ValueError('Cannot mmap non-regular file: %r' % filename)
+            size = st.st_size
+            if not size:
+                return
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            if fh is not _binary_stdin():
+                raise
+            # Unmappable stdin, ie a pipe
+            for buf in _iter_records(fh, delimiter=delimiter, record_size=record_size):
+                yield memoryview(buf)
+            return
+
+        view = memoryview(mm)
+        try:
+            for start, end in _iter_record_bounds(mm, size, delimiter=delimiter, record_size=record_size):
+                yield view[start:end]
+        finally:
+            view.release()
+    finally:
+        if mm is not None:
+            try:
+                mm.close()
+            except BufferError:
+                # Caller is still holding onto a slice; the map is closed once it's collected.
+                pass
+        if fh and fh is not _binary_stdin():
+            fh.close()
+
+
+def _iter_record_bounds(buf, size, delimiter=b'\n', record_size=None):
+    """Yield (start, end) offsets of each record within `buf`."""
+    if record_size:
+        for start in range(0, size, record_size):
+            yield start, min(start + record_size, size)
+        return
+
+    find = buf.find
+    step = len(delimiter)
+    start = 0
+    while start < size:
+        end = find(delimiter, start)
+        end = size if end == -1 else end + step
+        yield start, end
+        start = end
+
+
+def _iter_records(fh, delimiter=b'\n', record_size=None):
+    """Yield each record from a binary stream that cannot be mapped."""
+    if record_size:
+        read = functools.partial(fh.read, record_size)
+        for buf in iter(read, b''):
+            yield buf
+        return
+
+    if delimiter == b'\n':
+        for buf in fh:
+            yield buf
+        return
+
+    pending = b''
+    for chunk in iter(functools.partial(fh.read, DEFAULT_CHUNK_SIZE), b''):
+        pending += chunk
+        parts = pending.split(delimiter)
+        pending = parts.pop()
+        for part in parts:
+            yield part + delimiter
+    if pending:
+        yield pending
+
+
+class _PollWaiter(object):
+    """Waits for more data by sleeping, backing off exponentially while the file stays idle."""
+
+    def __init__(self, min_interval=0.01, max_interval=1.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+
+    def reset(self):
+        self.interval = self.min_interval
+
+    def _next_interval(self, timeout=None):
+        interval = self.interval
+        if timeout is not None:
+            interval = min(interval, timeout)
+        self.interval = min(self.interval * 2, self.max_interval)
+        return interval
+
+    def wait(self, timeout=None):
+        time.sleep(self._next_interval(timeout))
+
+    def async_wait(self, timeout=None):
+        import asyncio
+        return asyncio.sleep(self._next_interval(timeout))
+
+    def close(self):
+        pass
+
+
+class _InotifyWaiter(object):
+    """
+    Waits for more data by blocking on inotify events for `filename`.
+
+    The parent directory is watched rather than the file itself so creation and rotation are seen as well.
+    `max_interval` still bounds each wait as a safety net, ie for network filesystems that do not emit events.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    _event = struct.Struct('iIII')
+
+    def __init__(self, filename, max_interval=1.0):
+        import ctypes
+        import ctypes.util
+
+        self.max_interval = max_interval
+        self.basename = os.fsencode(os.path.basename(filename))
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        mask = (
+            self.IN_MODIFY | self.IN_ATTRIB | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE
+        )
+        dirname = os.path.dirname(os.path.abspath(filename))
+        if libc.inotify_add_watch(self.fd, os.fsencode(dirname), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed for %r' % dirname)
+
+    def reset(self):
+        pass
+
+    def _drain(self):
+        """Read all pending events, returning True if any were about our file."""
+        relevant = False
+        while True:
+            try:
+                buf = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return relevant
+            if not buf:
+                return relevant
+
+            pos = 0
+            while pos < len(buf):
+                _, _, _, name_len = self._event.unpack_from(buf, pos)
+                pos += self._event.size
+                name = buf[pos:pos + name_len].rstrip(b'\0')
+                pos += name_len
+                if name == self.basename:
+                    relevant = True
+
+    def wait(self, timeout=None):
+        import select
+
+        if timeout is None:
+            timeout = self.max_interval
+        deadline = time.time() + min(timeout, self.max_interval)
+
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if readable and self._drain():
+                return
+
+    async def async_wait(self, timeout=None):
+        import asyncio
+
+        if timeout is None:
+            timeout = self.max_interval
+        timeout = min(timeout, self.max_interval)
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+
+            ready = loop.create_future()
+            loop.add_reader(self.fd, lambda: ready.done() or ready.set_result(None))
+            try:
+                await asyncio.wait_for(ready, remaining)
+            except asyncio.TimeoutError:
+                return
+            finally:
+                loop.remove_reader(self.fd)
+
+            if self._drain():
+                return
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _make_waiter(filename, use_inotify=True, min_interval=0.01, max_interval=1.0):
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return _InotifyWaiter(filename, max_interval=max_interval)
+        except (OSError, AttributeError):
+            pass  # ie no libc inotify, or out of watches
+    return _PollWaiter(min_interval=min_interval, max_interval=max_interval)
+
+
+class _Follower(object):
+    """Reads whatever complete lines have been appended to `filename`, coping with truncation and rotation."""
+
+    def __init__(self, filename, mode='r', encoding=None, seek_end=False):
+        self.filename = filename
+        self.encoding = None
+        if 'b' not in mode:
+            self.encoding = encoding or locale.getpreferredencoding(False)
+        self.seek_end = seek_end
+
+        self.fh = None
+        self.ident = None
+        self.pending = b''
+
+    def _open(self):
+        try:
+            self.fh = open(self.filename, 'rb')
+        except (IOError, OSError):
+            return False  # does not exist (yet)
+
+        st = os.fstat(self.fh.fileno())
+        self.ident = (st.st_dev, st.st_ino)
+
+        if self.seek_end:
+            self.fh.seek(0, os.SEEK_END)
+        # Only skip existing contents the first time around; rotated in files are read from the start.
+        self.seek_end = False
+        return True
+
+    def _close(self):
+        if self.fh is not None:
+            self.fh.close()
+        self.fh = None
+        self.ident = None
+
+    def _decode(self, line):
+        if self.encoding:
+            return line.decode(self.encoding)
+        return line
+
+    def poll(self):
+        """Return a list of new complete lines, empty if there are none."""
+        lines = []
+        while self.fh is not None or self._open():
+            self._read_lines(lines)
+            if lines or not self._check_moved(lines):
+                break
+            # Rotated; go around again to pick up the new file right away.
+
+        return lines
+
+    def _read_lines(self, lines):
+        readline = self.fh.readline
+        while True:
+            line = readline()
+            if not line:
+                break
+            if not line.endswith(b'\n'):
+                # Writer is partway through a line; hold on to it until it's finished.
+                self.pending += line
+                break
+            if self.pending:
+                line, self.pending = self.pending + line, b''
+            lines.append(self._decode(line))
+
+    def _check_moved(self, lines):
+        """Handle truncation and rotation, returning True if the file was rotated (and therefore closed)."""
+        try:
+            st = os.stat(self.filename)
+        except (IOError, OSError):
+            st = None
+
+        if st is not None and (st.st_dev, st.st_ino) == self.ident:
+            if st.st_size < self.fh.tell():
+                # Truncated in place, ala `> file` or copytruncate
+                self.fh.seek(0)
+                self.pending = b''
+            return False
+
+        # Rotated away or removed. Everything left in the old file has been read, so flush out any partial line.
+        if self.pending:
+            lines.append(self._decode(self.pending))
+            self.pending = b''
+        self._close()
+        return True
+
+    def close(self):
+        self._close()
+
+
+def islurp_follow(
+        filename,
+        mode='r',
+        encoding=None,
+        seek_end=False,
+        idle_timeout=None,
+        use_inotify=True,
+        min_interval=0.01,
+        max_interval=1.0,
+        expanduser=True,
+        expandvars=True,
+):
+    """
+    Read [expanded] `filename` line by line, then keep yielding lines as they are appended, ala `tail -F`.
+
+    Waits for changes with inotify on Linux, falling back to polling with exponential backoff elsewhere.
+    Truncation, rotation and files that do not exist yet are handled by re-opening `filename` as needed.
+    For asyncio, see `pytutils.afiles.aislurp_follow`.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile() as tmp:
+    ...     burp(tmp.name, 'one\\ntwo\\n')
+    ...     list(islurp_follow(tmp.name, idle_timeout=0.1))
+    ['one\\n', 'two\\n']
+
+    :param str filename: File path
+    :param str mode: `r` for text lines (default), `rb` for bytes.
+    :param str encoding: Text encoding, defaults to the locale's.
+    :param bool seek_end: If Truthy, skip what is already in the file and only yield new lines.
+    :param float idle_timeout: Stop after this many seconds without a new line. Follows forever by default.
+    :param bool use_inotify: If Truthy and available, wait on inotify events instead of polling.
+    :param float min_interval: Shortest polling interval.
+    :param float max_interval: Longest polling interval, also the longest inotify wait.
+    :param bool expanduser: If Truthy, expand `~` in `filename`
+    :param bool expandvars: If Truthy, expand env vars in `filename`
+    :return generator: Generator of lines.
+    """
+    filename = _expand_path(filename, expanduser=expanduser, expandvars=expandvars)
+
+    follower = _Follower(filename, mode=mode, encoding=encoding, seek_end=seek_end)
+    waiter = _make_waiter(filename, use_inotify=use_inotify, min_interval=min_interval, max_interval=max_interval)
+    try:
+        idle_since = time.time()
+        while True:
+            lines = follower.poll()
+            if lines:
+                for line in lines:
+                    yield line
+                waiter.reset()
+                idle_since = time.time()
+                continue
+
+            timeout = None
+            if idle_timeout is not None:
+                timeout = idle_timeout - (time.time() - idle_since)
+                if timeout <= 0:
+                    return
+            waiter.wait(timeout)
+    finally:
+        follower.close()
+        waiter.close()
+
+
+# Default size of each range handed out by `islurp_parallel`.
+DEFAULT_SPLIT_SIZE = 64 * 1024 * 1024
+
+
+def iter_ranges(filename, chunk_size=DEFAULT_SPLIT_SIZE, delimiter=b'\n', expanduser=True, expandvars=True):
+    """
+    Split [expanded] `filename` into (start, end) byte ranges of roughly `chunk_size` bytes.
+
+    Each range ends right after a `delimiter` (or at EOF), so no record is ever split across two ranges.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile() as tmp:
+    ...     _ = tmp.write(b'aaa\\nbb\\nc\\ndddd\\n')
+    ...     tmp.flush()
+    ...     list(iter_ranges(tmp.name, chunk_size=5))
+    [(0, 7), (7, 14)]
+
+    :param str filename: File path
+    :param int chunk_size: Approximate size of each range in bytes.
+    :param bytes delimiter: Record delimiter. Default is by line.
+    :param bool expanduser: If Truthy, expand `~` in `filename`
+    :param bool expandvars: If Truthy, expand env vars in `filename`
+    :return generator: Generator of (start, end) tuples.
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive: %r' % chunk_size)
+
+    filename = _expand_path(filename, expanduser=expanduser, expandvars=expandvars)
+
+    with open(filename, 'rb') as fh:
+        size = os.fstat(fh.fileno()).st_size
+
+        start = 0
+        while start < size:
+            end = start + chunk_size
+            if end < size:
+                end = _find_boundary(fh, end, size, delimiter)
+            else:
+                end = size
+
+            yield start, end
+            start = end
+
+
+def _find_boundary(fh, pos, size, delimiter, block_size=64 * 1024):
+    """Find the offset right after the first `delimiter` ending at or after `pos`."""
+    overlap = len(delimiter) - 1
+    pos = max(pos - overlap, 0)
+
+    while pos < size:
+        fh.seek(pos)
+        block = fh.read(block_size + overlap)
+        if not block:
+            break
+
+        found = block.find(delimiter)
+        if found != -1:
+            return pos + found + len(delimiter)
+
+        pos += block_size
+
+    return size
+
+
+def read_range(filename, start, end):
+    """
+    Read bytes [start, end) of `filename`.
+
+    :param str filename: File path
+    :param int start: Start offset
+    :param int end: End offset
+    :return bytes: Data
+    """
+    with open(filename, 'rb') as fh:
+        fh.seek(start)
+        return fh.read(end - start)
+
+
+def _process_range(func, filename, bounds):
+    # Module level so it can be pickled over to process pools.
+    start, end = bounds
+    return func(read_range(filename, start, end))
+
+
+def islurp_parallel(
+        filename,
+        func,
+        chunk_size=DEFAULT_SPLIT_SIZE,
+        delimiter=b'\n',
+        ordered=True,
+        executor=None,
+        max_workers=None,
+        use_processes=True,
+        expanduser=True,
+        expandvars=True,
+        max_pending=None,
+):
+    """
+    Split [expanded] `filename` into delimiter aligned ranges and yield `func(data)` for each, computed in a pool.
+
+    Workers read their own range from disk, so only the filename and offsets cross process boundaries.
+    `func` must be picklable (ie a module level function) when using processes. Ranges are submitted lazily through
+    `pytutils.iters.parallel_map`, at most `max_pending` at a time, so memory use does not grow with the file size.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile() as tmp:
+    ...     _ = tmp.write(b'aaa\\nbb\\nc\\ndddd\\n')
+    ...     tmp.flush()
+    ...     list(islurp_parallel(tmp.name, len, chunk_size=5, use_processes=False))
+    [7, 7]
+
+    :param str filename: File path. Must be seekable, so stdin is not supported.
+    :param callable func: Called with the `bytes` of each range; its results are yielded.
+    :param int chunk_size: Approximate size of each range in bytes.
+    :param bytes delimiter: Record delimiter. Default is by line.
+    :param bool ordered: If Truthy, yield results in file order, otherwise as they finish.
+    :param concurrent.futures.Executor executor: Executor to use. If not given, one is created (and shut down) for you.
+    :param int max_workers: Worker count for the executor created for you.
+    :param bool use_processes: If Truthy, the executor created for you is a process pool, otherwise a thread pool.
+    :param bool expanduser: If Truthy, expand `~` in `filename`
+    :param bool expandvars: If Truthy, expand env vars in `filename`
+    :param int max_pending: Maximum number of ranges in flight. Defaults to twice the worker count.
+    :return generator: Generator of `func` results.
+    """
+    if filename == '-':
+        raise ValueError('Cannot split stdin into ranges; it is not seekable.')
+
+    filename = _expand_path(filename, expanduser=expanduser, expandvars=expandvars)
+    ranges = iter_ranges(filename, chunk_size=chunk_size, delimiter=delimiter, expanduser=False, expandvars=False)
+
+    return parallel_map(
+        functools.partial(_process_range, func, filename),
+        ranges,
+        executor=executor,
+        max_workers=max_workers,
+        use_processes=use_processes,
+        ordered=ordered,
+        max_pending=max_pending,
+    )
+
+
+def burp(
+        filename,
+        contents,
+        mode='w',
+        allow_stdout=True,
+        expanduser=True,
+        expandvars=True,
+        compression='auto',
+        compresslevel=None,
+        block_size=DEFAULT_BLOCK_SIZE,
+        atomic=False,
+        fsync=False,
+):
     """
     Write `contents` to `filename`.
+
+    `contents` can also be an iterable (or generator) of chunks, which are streamed out through a `block_size` buffer
+    instead of being joined in memory first.
+
+    Compresses on the fly if `filename` has a known compressed extension; see `COMPRESSION_CODECS`.
+
+    >>> import tempfile
+    >>> with tempfile.NamedTemporaryFile() as tmp:
+    ...     burp(tmp.name, ('line %d\\n' % i for i in range(3)), atomic=True)
+    ...     list(islurp(tmp.name))
+    ['line 0\\n', 'line 1\\n', 'line 2\\n']
+
+    :param str filename: File path
+    :param str|bytes|collections.Iterable contents: Contents to write, or an iterable of chunks to write
+    :param str mode: Use this mode to open `filename`, ala `w` for text (default), `wb` for binary, etc.
+    :param bool allow_stdout: If Truthy and filename is `-`, write to `sys.stdout`.
+    :param bool expanduser: If Truthy, expand `~` in `filename`
+    :param bool expandvars: If Truthy, expand env vars in `filename`
+    :param str compression: Codec name, `auto` to detect it by extension (default), or None to write as is.
+    :param int compresslevel: Codec specific compression level (for bz2 this is also the block size).
+    :param int block_size: Buffer size used between the writer and the file.
+    :param bool atomic: If Truthy, write to a temp file next to `filename` and rename it into place once complete,
+                        so readers never see a partially written file.
+    :param bool fsync: If Truthy, fsync the file (and for atomic writes, its directory) before returning.
     """
     if filename == '-' and allow_stdout:
-        sys.stdout.write(contents)
+        if compression in (None, 'auto'):
+            _write_contents(sys.stdout, contents)
+            return
+
+        raw = getattr(sys.stdout, 'buffer', sys.stdout)
+        with _open_codec(raw, compression, mode, compresslevel=compresslevel, block_size=block_size) as fh:
+            _write_contents(fh, contents)
+        return
+
+    filename = _expand_path(filename, expanduser=expanduser, expandvars=expandvars)
+
+    codec = _resolve_compression(compression, filename=filename) if compression else None
+    raw_mode = mode
+    if codec:
+        raw_mode = mode.replace('t', '').replace('b', '') + 'b'
+
+    opener = _atomic_open if atomic else _open
+    with opener(filename, raw_mode, buffering=block_size, fsync=fsync) as raw:
+        if codec:
+            with _open_codec(raw, codec, mode, compresslevel=compresslevel, block_size=block_size) as fh:
+                _write_contents(fh, contents)
+        else:
+            _write_contents(raw, contents)
+
+
+def _write_contents(fh, contents):
+    if isinstance(contents, (six.string_types, six.binary_type, bytearray, memoryview)):
+        fh.write(contents)
     else:
-        if expanduser:
-            filename = os.path.expanduser(filename)
-        if expandvars:
-            filename = os.path.expandvars(filename)
+        fh.writelines(contents)
+
+
+@contextlib.contextmanager
+def _open(filename, mode, buffering=-1, fsync=False):
+    with open(filename, mode, buffering) as fh:
+        yield fh
+
+        if fsync:
+            fh.flush()
+            os.fsync(fh.fileno())
+
+
+@contextlib.contextmanager
+def _atomic_open(filename, mode, buffering=-1, fsync=False):
+    """Open a temp file next to `filename` for writing, renaming it over `filename` on success."""
+    if not mode.startswith('w'):
+        raise ValueError('Atomic writes only support truncating write modes, not %r' % mode)
+
+    dirname, basename = os.path.split(filename)
+    tmp_filename = os.path.join(dirname, '.%s.%s.tmp' % (basename, binascii.hexlify(os.urandom(6)).decode()))
+
+    # os.open (vs mkstemp) so the umask is honored just like a plain open() would
+    fd = os.open(tmp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with io.open(fd, mode, buffering) as fh:
+            yield fh
+
+            fh.flush()
+            if fsync:
+                os.fsync(fh.fileno())
+
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        try:
+            os.unlink(tmp_filename)
+        except OSError:
+            pass
+        raise
+
+    if fsync:
+        _fsync_dir(dirname or os.curdir)
+
+
+def _fsync_dir(dirname):
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return  # ie Windows
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def burp_many(items, executor=None, max_workers=None, max_pending=None, **kwargs):
+    """
+    Write many files concurrently using a thread pool, ala `burp` for each.
+
+    Submission is bounded by `max_pending` so `items` can be a lazy generator without everything ending up queued
+    in memory.
+
+    >>> import tempfile
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> burp_many((os.path.join(tmpdir, str(i)), 'file %d' % i) for i in range(100))
+    100
+    >>> list(islurp(os.path.join(tmpdir, '42')))
+    ['file 42']
+    >>> import shutil; shutil.rmtree(tmpdir)
+
+    :param collections.Iterable|collections.Mapping items: Mapping or iterable of (filename, contents)
+    :param concurrent.futures.Executor executor: Executor to use. If not given, a thread pool is created for you.
+    :param int max_workers: Worker count for the thread pool created for you.
+    :param int max_pending: Maximum number of writes in flight. Defaults to four per worker.
+    :param kwargs: Passed through to `burp`, ie `atomic=True`.
+    :return int: Number of files written
+    """
+    import concurrent.futures
+
+    if hasattr(items, 'items'):
+        items = items.items()
+
+    own_executor = executor is None
+    if own_executor:
+        max_workers = max_workers or min(32, (os.cpu_count() or 1) * 4)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    if max_pending is None:
+        max_pending = (max_workers or 8) * 4
+
+    written = 0
+    pending = set()
+    try:
+        for filename, contents in items:
+            if len(pending) >= max_pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    written += 1
+
+            pending.add(executor.submit(burp, filename, contents, allow_stdout=False, **kwargs))
+
+        for future in concurrent.futures.as_completed(pending):
+            future.result()
+            written += 1
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
 
-        with open(filename, mode) as fh:
-            fh.write(contents)
+    return written
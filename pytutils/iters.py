@@ -1,10 +1,70 @@
 import wrapt
 import collections
+import functools
 import itertools
 import operator
+import threading
 
+from six.moves.queue import Queue, Full
 
-def accumulate(iterable, func=operator.add):
+
+_sentinel = object()
+
+# Funcs with a numpy ufunc equivalent that can do the whole accumulation in C
+_UFUNC_NAMES = {
+    operator.add: 'add',
+    operator.mul: 'multiply',
+    max: 'maximum',
+    min: 'minimum',
+}
+
+_NUMERIC_KINDS = frozenset('biufc')
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _get_ufunc(func):
+    name = _UFUNC_NAMES.get(func)
+    if name is None:
+        return None
+
+    np = _numpy()
+    if np is None:
+        return None
+    return getattr(np, name)
+
+
+def _as_array(iterable, np):
+    """Return a 1d numeric array view of `iterable` if it is an ndarray or exposes the buffer protocol, else None."""
+    if isinstance(iterable, np.ndarray):
+        arr = iterable
+    else:
+        try:
+            memoryview(iterable)
+        except TypeError:
+            return None
+
+        try:
+            arr = np.asarray(iterable)
+        except (TypeError, ValueError):
+            return None
+
+        # Small ints would overflow long before python ints do; upcast so the results match.
+        if arr.dtype.kind in 'iu' and arr.dtype.itemsize < 8:
+            arr = arr.astype(np.int64)
+
+    if arr.ndim != 1 or arr.dtype.kind not in _NUMERIC_KINDS:
+        return None
+    return arr
+
+
+def accumulate(iterable, func=operator.add, chunk_size=None):
     """
     Iterate over running totals, ie [a,b,c,d] -> func( func( func(a, b), c), d) with each func result yielded.
     Func is operator.add by default.
@@ -14,21 +74,87 @@ def accumulate(iterable, func=operator.add):
     >>> list(accumulate([1,2,3,4,5], operator.mul))
     [1, 2, 6, 24, 120]
 
+    If numpy is available, `iterable` is a 1d ndarray (or anything numeric exposing the buffer protocol, such as an
+    `array.array`) and `func` is one of `operator.add`, `operator.mul`, `max` or `min`, the accumulation is done by
+    the matching ufunc's `accumulate` in one go and an ndarray is returned.
+
+    With `chunk_size`, `iterable` is consumed `chunk_size` items at a time and each chunk of running totals is yielded
+    as a whole (as an ndarray when the above applies, a list otherwise), carrying the total across chunks:
+
+    >>> [[int(x) for x in chunk] for chunk in accumulate(range(1, 7), chunk_size=4)]
+    [[1, 3, 6, 10], [15, 21]]
+
     :param iterable: Iterable
     :param func: method (default=operator.add) to call for each pair of (last call result or first item, next item)
-    :return generator: Generator
+    :param int chunk_size: If set, yield chunks of running totals of this size instead of each one.
+    :return generator|numpy.ndarray: Generator, or ndarray if vectorized
     """
+    if chunk_size:
+        return accumulate_chunks(chunked(iterable, chunk_size), func=func)
+
+    ufunc = _get_ufunc(func)
+    if ufunc is not None:
+        arr = _as_array(iterable, _numpy())
+        if arr is not None:
+            return ufunc.accumulate(arr)
+
+    return _accumulate(iterable, func)
+
+
+def _accumulate(iterable, func, total=_sentinel):
     it = iter(iterable)
-    try:
-        total = next(it)
-    except StopIteration:
-        return
-    yield total
+    if total is _sentinel:
+        try:
+            total = next(it)
+        except StopIteration:
+            return
+        yield total
     for element in it:
         total = func(total, element)
         yield total
 
 
+def accumulate_chunks(chunks, func=operator.add):
+    """
+    Accumulate over an iterable of chunks (ie ndarrays read off a stream), yielding each chunk's running totals.
+
+    The running total is carried across chunk boundaries, so concatenating the output is the same as accumulating
+    over the concatenated input. Chunks that are ndarrays or numeric buffers are vectorized just like `accumulate`;
+    anything else (ie plain lists) is accumulated as is, so python ints never overflow a fixed width dtype.
+
+    >>> [list(chunk) for chunk in accumulate_chunks([['a', 'b'], ['c']])]
+    [['a', 'ab'], ['abc']]
+    >>> list(accumulate_chunks([[2 ** 62, 2 ** 62], [2 ** 62]]))
+    [[4611686018427387904, 9223372036854775808], [13835058055282163712]]
+
+    :param chunks: Iterable of iterables
+    :param func: method (default=operator.add) to call for each pair of (last call result or first item, next item)
+    :return generator: Generator of ndarrays (if vectorized) or lists of running totals
+    """
+    ufunc = _get_ufunc(func)
+    np = _numpy() if ufunc is not None else None
+
+    total = _sentinel
+    for chunk in chunks:
+        arr = None
+        if ufunc is not None:
+            arr = _as_array(chunk, np)
+
+        if arr is not None:
+            if not len(arr):
+                continue
+            out = ufunc.accumulate(arr)
+            if total is not _sentinel:
+                out = ufunc(total, out)
+        else:
+            out = list(_accumulate(chunk, func, total=total))
+            if not out:
+                continue
+
+        total = out[-1]
+        yield out
+
+
 def consume(iterator, n=None):
     """
     Efficiently advance an iterator n-steps ahead. If n is none, consume entirely.
@@ -42,15 +168,62 @@ def consume(iterator, n=None):
         next(itertools.islice(iterator, n, n), None)
 
 
-def dedupe_iter(iterator, hashfunc=hash):
+def dedupe_iter(iterator, hashfunc=None, done=None):
     """"
     Deduplicates an iterator iteratively using hashed values in a set.
     Not exactly memory efficient because of that of course.
-    If you have a large dataset with high cardinality look at HyperLogLog instead.
 
+    For large datasets with high cardinality, pass a bounded `done` store instead, such as
+    `pytutils.sets.BloomFilter`, `pytutils.sets.CuckooFilter` or `pytutils.sets.TTLSet`.
+    To dedupe across worker processes, share a `pytutils.sets.SharedMemorySet` between them.
+
+    >>> list(dedupe_iter([1, 2, 1, 3, 2]))
+    [1, 2, 3]
+
+    Stores with `add_if_absent` are given the items themselves by default, as they fingerprint them the same way in
+    every process, unlike `hash` (see PYTHONHASHSEED); so this holds for spawned workers too:
+
+    >>> import multiprocessing
+    >>> from pytutils.sets import SharedMemorySet
+    >>> ctx = multiprocessing.get_context('spawn')
+    >>> seen, results = SharedMemorySet(capacity=100, context=ctx), ctx.Queue()
+    >>> worker = 'from pytutils.iters import dedupe_iter; results.put(list(dedupe_iter("abc", done=seen)))'
+    >>> procs = [ctx.Process(target=exec, args=(worker, dict(seen=seen, results=results))) for _ in range(2)]
+    >>> for proc in procs:
+    ...     proc.start()
+    >>> sorted(item for _ in procs for item in results.get())
+    ['a', 'b', 'c']
+    >>> for proc in procs:
+    ...     proc.join()
+
+    Equal items are duplicates whichever objects they are made of:
+
+    >>> x = 'ab'
+    >>> list(dedupe_iter([(x, x), (x, ''.join(['a', 'b'])), (1, 2.0), (1.0, 2)], done=seen))
+    [('ab', 'ab'), (1, 2.0)]
+    >>> seen.unlink()
+
+    :param iterator: Iterable to dedupe
+    :param hashfunc: Func to hash each item with before storing it in `done`. Defaults to `hash`, or to passing items
+                     as is to stores with `add_if_absent`.
+    :param done: Store of seen hashes; anything supporting `in` and `add` (or an atomic `add_if_absent`, such as
+                 `pytutils.sets.SharedMemorySet`). Defaults to a new `set`.
     :return generator: Iterator of deduplicated results.
     """
-    done = set()
+    if done is None:
+        done = set()
+
+    # Stores shared between processes need the check and the add to be one atomic step
+    add_if_absent = getattr(done, 'add_if_absent', None)
+    if add_if_absent is not None:
+        for item in iterator:
+            if add_if_absent(item if hashfunc is None else hashfunc(item)):
+                yield item
+        return
+
+    if hashfunc is None:
+        hashfunc = hash
+
     for item in iterator:
         hashed = hashfunc(item)
 
@@ -61,16 +234,228 @@ def dedupe_iter(iterator, hashfunc=hash):
         yield item
 
 
-@wrapt.decorator
-def dedupe(f, instance, args, kwargs):
+def dedupe(f=None, hashfunc=None, done_factory=set):
     """
     Decorator to dedupe it's output iterable automatically.
 
+    Can be used bare, or called to pick the store each call dedupes with:
+
+    >>> from pytutils.sets import BloomFilter
+    >>> @dedupe(done_factory=lambda: BloomFilter(capacity=1000))
+    ... def gen():
+    ...     return iter([1, 2, 1, 3])
+    >>> list(gen())
+    [1, 2, 3]
+
     :param f: Wrapped meth
-    :param instance: wrapt provided property for decorating hydrated class instances (unused)
-    :param args: Passthrough args
-    :param kwargs: Passthrough kwargs
+    :param hashfunc: Func to hash each item with, see `dedupe_iter`
+    :param done_factory: Callable returning a new store of seen hashes for each call, see `dedupe_iter`
     :return decorator: Decorator method that ingests iterables and dedupes them iteratively.
     """
-    gen = f(*args, **kwargs)
-    return dedupe_iter(gen)
+    if f is None:
+        return functools.partial(dedupe, hashfunc=hashfunc, done_factory=done_factory)
+
+    @wrapt.decorator
+    def wrapper(wrapped, instance, args, kwargs):
+        gen = wrapped(*args, **kwargs)
+        return dedupe_iter(gen, hashfunc=hashfunc, done=done_factory())
+
+    return wrapper(f)
+
+
+def chunked(iterable, size):
+    """
+    Iterate over lists of `size` items at a time; the last one may be shorter.
+
+    >>> list(chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+
+    :param iterable: Iterable
+    :param int size: Items per chunk
+    :return generator: Generator of lists
+    """
+    if size < 1:
+        raise ValueError('size must be positive: %r' % size)
+
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# alias
+batched = chunked
+
+
+def flatten(chunks):
+    """
+    Iterate over the items of each chunk in turn; the inverse of `chunked`.
+
+    >>> list(flatten([[0, 1], [2]]))
+    [0, 1, 2]
+    """
+    return itertools.chain.from_iterable(chunks)
+
+
+def prefetch(iterable, size=1):
+    """
+    Iterate `iterable` in a background thread, staying up to `size` items ahead of the consumer.
+
+    Useful to overlap I/O bound producers (reading, decompressing) with CPU bound consumers. Exceptions raised by
+    `iterable` are re-raised to the consumer. Closing the returned generator stops the background thread.
+
+    >>> list(prefetch(range(5), 2))
+    [0, 1, 2, 3, 4]
+
+    :param iterable: Iterable
+    :param int size: Maximum number of items to read ahead
+    :return generator: Generator
+    """
+    queue = Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as exc:
+            put((done, exc))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close:
+                close()
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item, exc = queue.get()
+            if item is done:
+                if exc is not None:
+                    raise exc
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _map_chunk(func, chunk):
+    # Module level so it can be pickled over to process pools.
+    return [func(item) for item in chunk]
+
+
+def parallel_map(
+        func,
+        iterable,
+        executor=None,
+        max_workers=None,
+        use_processes=False,
+        ordered=True,
+        max_pending=None,
+        chunk_size=None,
+):
+    """
+    Map `func` over `iterable` in a thread or process pool, yielding results lazily.
+
+    At most `max_pending` tasks are in flight at once, so a fast producer or a slow consumer never causes unbounded
+    buffering. Results are yielded in input order, or with `ordered=False` as soon as each is ready.
+
+    >>> list(parallel_map(lambda x: x * 2, range(5)))
+    [0, 2, 4, 6, 8]
+
+    :param callable func: Called with each item. Must be picklable (ie module level) when using processes.
+    :param iterable: Iterable
+    :param concurrent.futures.Executor executor: Executor to use. If not given, one is created (and shut down) for you.
+    :param int max_workers: Worker count for the executor created for you.
+    :param bool use_processes: If Truthy, the executor created for you is a process pool, otherwise a thread pool.
+    :param bool ordered: If Truthy, yield results in input order, otherwise as they finish.
+    :param int max_pending: Maximum number of tasks in flight. Defaults to twice the worker count.
+    :param int chunk_size: If set, send items to workers this many at a time, which cuts per task overhead.
+    :return generator: Generator of results
+    """
+    import concurrent.futures
+
+    if chunk_size:
+        chunks = parallel_map(
+            functools.partial(_map_chunk, func),
+            chunked(iterable, chunk_size),
+            executor=executor,
+            max_workers=max_workers,
+            use_processes=use_processes,
+            ordered=ordered,
+            max_pending=max_pending,
+        )
+        for item in flatten(chunks):
+            yield item
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        if use_processes:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    if max_pending is None:
+        max_pending = 2 * (max_workers or getattr(executor, '_max_workers', None) or 4)
+
+    pending = collections.deque() if ordered else set()
+    try:
+        for item in iterable:
+            if len(pending) >= max_pending:
+                if ordered:
+                    yield pending.popleft().result()
+                else:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+
+            future = executor.submit(func, item)
+            if ordered:
+                pending.append(future)
+            else:
+                pending.add(future)
+
+        if ordered:
+            while pending:
+                yield pending.popleft().result()
+        else:
+            for future in concurrent.futures.as_completed(pending):
+                yield future.result()
+            pending = ()
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True)
+
+
+def parallel_filter(func, iterable, **kwargs):
+    """
+    Filter `iterable` by `func` computed in a pool, ala `parallel_map`, which the kwargs are passed through to.
+
+    >>> list(parallel_filter(lambda x: x % 2, range(5)))
+    [1, 3]
+    """
+    pairs = parallel_map(functools.partial(_filter_pair, func), iterable, **kwargs)
+    return (item for keep, item in pairs if keep)
+
+
+def _filter_pair(func, item):
+    return bool(func(item)), item
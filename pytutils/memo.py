@@ -1,15 +1,35 @@
+import asyncio
+import bisect
+import collections
 import functools
+import inspect
+import logging
+import random
+import threading
+import time
+import warnings
 
 import cachetools
+import cachetools.keys
+import six
 
+from .caches import MemoCache  # noqa: F401 (re-exported, and used by doctests)
 from .props import lazyclassproperty, lazyperclassproperty
 
+_LOG = logging.getLogger(__name__)
+
 _default = []  # evaluates to False
+_sentinel = object()
 
 
 class CachedException(object):
-    def __init__(self, ex):
+    def __init__(self, ex, ttl=None):
         self.ex = ex
+        # Wall clock, as these get pickled into caches that outlive the process (and monotonic clocks reset on boot)
+        self.expires = None if ttl is None else time.time() + ttl
+
+    def expired(self):
+        return self.expires is not None and self.expires <= time.time()
 
     def throw(self):
         raise self.ex
@@ -17,11 +37,511 @@ class CachedException(object):
     __call__ = throw
 
 
-def cachedmethod(cache, key=_default, lock=None, typed=_default, cached_exception=None):
+class ExceptionPolicy(object):
+    """
+    Negative caching policy for the exceptions `cachedmethod` and `cached` cache; pass as `exception_policy=`.
+
+    Exceptions whose type (or a base of it) is in `ttls` are cached for that many seconds, or forever for None; ie for
+    permanent failures. Any other is cached for `ttl` seconds, or with `backoff`, for exponentially longer after each
+    consecutive failure of the same key: `backoff`, twice that, four times that, up to `max_backoff`, each randomized
+    by +/- `jitter` so that keys failing together are not all retried together. A success resets the backoff.
+
+    At most `max_entries` keys are tracked as failing; beyond that the oldest negative entry is dropped from its cache.
+
+    >>> policy = ExceptionPolicy(ttls={KeyError: None}, backoff=1, jitter=0)
+    >>> policy.exceptions
+    (<class 'KeyError'>,)
+    >>> [policy.wrap(None, 'key', IOError()).expires is None for _ in range(3)]
+    [False, False, False]
+    >>> policy.failures(None, 'key')
+    3
+    >>> policy.wrap(None, 'other', KeyError()).expires is None
+    True
+    """
+
+    def __init__(self, ttl=None, ttls=None, backoff=None, max_backoff=300, jitter=0.1, max_entries=1024):
+        """
+        :param float ttl: Seconds to cache exceptions not in `ttls` for when not backing off. None is forever.
+        :param dict ttls: Mapping of exception type to seconds to cache it for, None being forever.
+        :param float backoff: Seconds to cache the first consecutive failure of a key for, doubling on each after.
+        :param float max_backoff: Upper bound of the backoff.
+        :param float jitter: Fraction to randomize backoffs by.
+        :param int max_entries: Max number of negative entries to keep; None for no limit.
+        """
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.max_entries = max_entries
+
+        # (id(cache), key) -> [cache, lock, consecutive failures], oldest first
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<%s ttl=%r ttls=%r backoff=%r entries=%d>' % (
+            self.__class__.__name__, self.ttl, self.ttls, self.backoff, len(self._entries)
+        )
+
+    @property
+    def exceptions(self):
+        """Exception types given TTLs, to catch when `cached_exception` is not given."""
+        return tuple(self.ttls)
+
+    def ttl_for(self, ex, failures=1):
+        """
+        :param Exception ex: Exception to be cached
+        :param int failures: Consecutive failures of its key, including this one
+        :return float: Seconds to cache it for, None for forever
+        """
+        for cls in type(ex).__mro__:
+            if cls in self.ttls:
+                return self.ttls[cls]
+
+        if self.backoff is None:
+            return self.ttl
+
+        ttl = min(self.backoff * 2 ** min(failures - 1, 64), self.max_backoff)
+        if self.jitter:
+            ttl *= 1 + random.uniform(-self.jitter, self.jitter)
+        return ttl
+
+    def failures(self, cache, key):
+        """
+        :return int: Number of consecutive failures tracked for `key` in `cache`
+        """
+        entry = self._entries.get((id(cache), key))
+        return entry[2] if entry else 0
+
+    def wrap(self, cache, key, ex, lock=None):
+        """
+        Track another failure of `key` in `cache` and wrap `ex` for caching.
+
+        :return CachedException: To store in `cache`
+        """
+        ident = (id(cache), key)
+        victims = []
+        with self._lock:
+            entry = self._entries.pop(ident, None)
+            if entry is None:
+                entry = [cache, lock, 0]
+            entry[2] += 1
+            self._entries[ident] = entry
+
+            if self.max_entries is not None:
+                while len(self._entries) > self.max_entries:
+                    (_, victim_key), (victim_cache, victim_lock, _) = self._entries.popitem(last=False)
+                    victims.append((victim_cache, victim_key, victim_lock))
+
+        for victim_cache, victim_key, victim_lock in victims:
+            self._drop(victim_cache, victim_key, victim_lock)
+
+        return CachedException(ex, ttl=self.ttl_for(ex, entry[2]))
+
+    def forget(self, cache, key):
+        """
+        Reset tracking of `key` in `cache`, ie on success.
+        """
+        if self._entries:
+            with self._lock:
+                self._entries.pop((id(cache), key), None)
+
+    @staticmethod
+    def _drop(cache, key, lock):
+        if cache is None:
+            return
+        try:
+            if lock is not None:
+                with lock:
+                    _drop_negative(cache, key)
+            else:
+                _drop_negative(cache, key)
+        except KeyError:
+            pass
+
+
+def _drop_negative(cache, key):
+    value = cache[key]
+    while isinstance(value, (_Stamped, _Tagged)):
+        value = value.value
+    if isinstance(value, CachedException):
+        del cache[key]
+
+
+class _Call(object):
+    __slots__ = ('event', 'result', 'exc')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc = None
+
+
+class SingleFlight(object):
+    """
+    Collapses concurrent calls for the same key into one; the first caller computes, the rest wait for its outcome.
+
+    The in-flight table is striped by key hash, and its locks are only held to register or finish a call, never while
+    computing, so callers of unrelated keys never wait on each other.
+
+    >>> flight = SingleFlight()
+    >>> flight.do('key', lambda: 42)
+    42
+
+    Threads asking for the same key together share one call, and what it raised:
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> calls, barrier = [], threading.Barrier(8)
+    >>> def fail():
+    ...     calls.append(1)
+    ...     time.sleep(0.1)
+    ...     raise ValueError('boom')
+    >>> def call():
+    ...     barrier.wait()
+    ...     try:
+    ...         flight.do('key', fail)
+    ...     except ValueError as exc:
+    ...         return exc
+    >>> with ThreadPoolExecutor(8) as executor:
+    ...     errors = list(executor.map(lambda _: call(), range(8)))
+    >>> len(calls), len(errors), len(set(map(id, errors)))
+    (1, 8, 1)
+    """
+
+    def __init__(self, stripes=64):
+        self._stripes = [(threading.Lock(), {}) for _ in range(stripes)]
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call `func(*args, **kwargs)` unless a call for `key` is already in flight, in which case wait on its outcome.
+
+        :return: Result of the call, or re-raise what it raised
+        """
+        lock, calls = self._stripes[hash(key) % len(self._stripes)]
+
+        with lock:
+            call = calls.get(key)
+            leader = call is None
+            if leader:
+                call = calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.exc is not None:
+                raise call.exc
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as exc:
+            call.exc = exc
+            raise
+        finally:
+            with lock:
+                del calls[key]
+            call.event.set()
+
+
+class AsyncSingleFlight(object):
+    """
+    Asyncio flavor of `SingleFlight`; concurrent awaiters of the same key share one in-flight future.
+
+    >>> import asyncio
+    >>> async def compute():
+    ...     return 42
+    >>> asyncio.run(AsyncSingleFlight().do('key', compute))
+    42
+
+    >>> calls = []
+    >>> async def counted():
+    ...     calls.append(1)
+    ...     await asyncio.sleep(0.01)
+    ...     return 42
+    >>> async def burst(flight):
+    ...     return await asyncio.gather(*[flight.do('key', counted) for _ in range(5)])
+    >>> asyncio.run(burst(AsyncSingleFlight())), len(calls)
+    ([42, 42, 42, 42, 42], 1)
+
+    A caller giving up (ie timing out) does not cancel the call for the others waiting on it:
+
+    >>> async def slow():
+    ...     await asyncio.sleep(0.05)
+    ...     return 'done'
+    >>> async def main(flight):
+    ...     leader = asyncio.ensure_future(asyncio.wait_for(flight.do('key', slow), 0.01))
+    ...     await asyncio.sleep(0)
+    ...     follower = asyncio.ensure_future(flight.do('key', slow))
+    ...     return await asyncio.gather(leader, follower, return_exceptions=True)
+    >>> asyncio.run(main(AsyncSingleFlight()))
+    [TimeoutError(), 'done']
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Await `func(*args, **kwargs)` unless a call for `key` is already in flight, in which case await its outcome.
+
+        :return: Result of the call, or re-raise what it raised
+        """
+        loop = asyncio.get_event_loop()
+        # Tasks belong to their loop, so never share them across loops (ie threads)
+        key = (id(loop), key)
+
+        task = self._calls.get(key)
+        if task is None:
+            # The call runs in its own task, so it is not tied to (and cancelled with) whoever happened to start it
+            task = self._calls[key] = loop.create_task(func(*args, **kwargs))
+            task.add_done_callback(functools.partial(self._done, key))
+
+        # Shielded so a cancelled caller only stops waiting itself, leaving the call running for everyone else
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved, there may be nobody left waiting on it
+
+
+# Upper bounds (in seconds) of compute latency histogram buckets; powers of two from 1us up, plus a catch all
+LATENCY_BUCKETS = tuple(2 ** i / 1e6 for i in range(27)) + (float('inf'), )
+
+_stats_registry = {}
+_stats_hooks = []
+
+
+class MemoStats(object):
+    """
+    Opt-in instrumentation for a memoized function; pass `stats=` to `cachedmethod`, `cached` and friends.
+
+    Records hits, misses, evictions, cached exceptions, a compute latency histogram and the hottest keys (tracked
+    with a `pytutils.sets.CountMinSketch`). Counts are approximate under heavy concurrency.
+
+    >>> stats = MemoStats('square', register=False)
+    >>> @cached(MemoCache(maxsize=128), stats=stats)
+    ... def square(x):
+    ...     return x * x
+    >>> for x in [1, 2, 1, 1]:
+    ...     _ = square(x)
+    >>> snapshot = stats.snapshot()
+    >>> snapshot['hits'], snapshot['misses'], snapshot['hit_ratio'], snapshot['computes']
+    (2, 2, 0.5, 2)
+    >>> snapshot['top_keys'][0]
+    ('(1,)', 3)
+    """
+
+    def __init__(self, name, topk=10, sketch_width=2048, register=True):
+        """
+        :param str name: Name to register and report as.
+        :param int topk: Number of hottest keys to keep track of. 0 disables key tracking.
+        :param int sketch_width: Width of the count-min sketch used to count keys.
+        :param bool register: If Truthy, add to the registry `get_stats` reports from.
+        """
+        from .sets import CountMinSketch
+
+        self.name = name
+        self.topk = topk
+        self._sketch = CountMinSketch(width=sketch_width) if topk else None
+        self._top = {}
+        self._lock = threading.Lock()
+        self.reset()
+
+        if register:
+            _stats_registry[name] = self
+
+    def __repr__(self):
+        return '<%s %r hits=%d misses=%d>' % (self.__class__.__name__, self.name, self.hits, self.misses)
+
+    def reset(self):
+        self.hits = self.misses = self.evictions = self.exceptions_cached = 0
+        self.computes = 0
+        self.compute_time = 0.0
+        self.compute_time_max = 0.0
+        self.latency = [0] * len(LATENCY_BUCKETS)
+        with self._lock:
+            if self._sketch is not None:
+                self._sketch = self._sketch.__class__(width=self._sketch.width, depth=self._sketch.depth)
+            self._top = {}
+
+    def _emit(self, event, value):
+        for hook in _stats_hooks:
+            hook(self.name, event, value)
+
+    def _count_key(self, key):
+        if self._sketch is None:
+            return
+        with self._lock:
+            estimate = self._sketch.add(key)
+            top = self._top
+            if key in top or len(top) < self.topk:
+                top[key] = estimate
+                return
+            coldest = min(top, key=top.get)
+            if estimate > top[coldest]:
+                del top[coldest]
+                top[key] = estimate
+
+    def record_hit(self, key):
+        self.hits += 1
+        self._count_key(key)
+        if _stats_hooks:
+            self._emit('hit', key)
+
+    def record_miss(self, key):
+        self.misses += 1
+        self._count_key(key)
+        if _stats_hooks:
+            self._emit('miss', key)
+
+    def record_compute(self, seconds, exception_cached=False):
+        self.computes += 1
+        self.compute_time += seconds
+        if seconds > self.compute_time_max:
+            self.compute_time_max = seconds
+        self.latency[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+        if exception_cached:
+            self.exceptions_cached += 1
+        if _stats_hooks:
+            self._emit('compute', seconds)
+            if exception_cached:
+                self._emit('exception_cached', seconds)
+
+    def record_evictions(self, count):
+        self.evictions += count
+        if _stats_hooks:
+            self._emit('evictions', count)
+
+    def snapshot(self):
+        """
+        :return dict: Point in time copy of all counters, the latency histogram as {bucket upper bound: count} and
+                      the hottest keys as [(repr(key), estimated count)] hottest first.
+        """
+        lookups = self.hits + self.misses
+        with self._lock:
+            top = sorted(self._top.items(), key=lambda item: item[1], reverse=True)
+
+        return dict(
+            name=self.name,
+            hits=self.hits,
+            misses=self.misses,
+            hit_ratio=self.hits / float(lookups) if lookups else 0.0,
+            evictions=self.evictions,
+            exceptions_cached=self.exceptions_cached,
+            computes=self.computes,
+            compute_time=self.compute_time,
+            compute_time_max=self.compute_time_max,
+            latency=collections.OrderedDict(zip(LATENCY_BUCKETS, self.latency)),
+            top_keys=[(repr(key), count) for key, count in top],
+        )
+
+
+def get_stats(name=None):
+    """
+    Snapshot the registered `MemoStats`.
+
+    :param str name: Only snapshot this one
+    :return dict: {name: snapshot}, or just the snapshot if `name` was given
+    """
+    if name is not None:
+        return _stats_registry[name].snapshot()
+    return {name: stats.snapshot() for name, stats in list(_stats_registry.items())}
+
+
+def subscribe_stats(hook):
+    """
+    Call `hook(name, event, value)` on every recorded event of every `MemoStats`, ie to feed an exporter.
+
+    Events are `hit`/`miss` (value is the key), `compute`/`exception_cached` (value is the latency in seconds) and
+    `evictions` (value is the count).
+    """
+    _stats_hooks.append(hook)
+
+
+def unsubscribe_stats(hook):
+    _stats_hooks.remove(hook)
+
+
+def _resolve_stats(stats, func):
+    if stats is None or stats is False or isinstance(stats, MemoStats):
+        return stats or None
+    if stats is True:
+        stats = '%s.%s' % (func.__module__, getattr(func, '__qualname__', func.__name__))
+    existing = _stats_registry.get(stats)
+    return existing if existing is not None else MemoStats(stats)
+
+
+def cachedmethod(
+        cache,
+        key=_default,
+        lock=None,
+        typed=_default,
+        cached_exception=None,
+        single_flight=False,
+        exception_ttl=None,
+        refresh_after=None,
+        refresh_executor=None,
+        stats=None,
+        exception_policy=None,
+        tags=None,
+        generations=None,
+):
     """Decorator to wrap a class or instance method with a memoizing
     callable that saves results in a cache.
 
-    You can also specify a cached exception to cache and re-throw as well.
+    You can also specify a cached exception to cache and re-throw as well, for up to `exception_ttl` seconds if given.
+    For per type TTLs, backoff on consecutive failures and a cap on negative entries, pass an `ExceptionPolicy` as
+    `exception_policy` instead; it then also decides what to cache if `cached_exception` is not given.
+
+    Any `cachetools` style cache works; `pytutils.caches.MemoCache` adds LFU/TinyLFU eviction, TTLs, per entry costs
+    and hit/miss stats. Use `instance_cache` to give each instance its own:
+
+    >>> square_cache = instance_cache(lambda: MemoCache(maxsize=128, policy='tinylfu'))
+    >>> class Lookup(object):
+    ...     @cachedmethod(square_cache)
+    ...     def square(self, x):
+    ...         return x * x
+    >>> lookup = Lookup()
+    >>> lookup.square(3), lookup.square(3)
+    (9, 9)
+    >>> square_cache(lookup).stats()['hits']
+    1
+
+    With `single_flight`, when a key misses only one caller computes it while concurrent callers for the same key wait
+    on its result (or exception). Coroutine methods are supported, caching their awaited result; see `acachedmethod`.
+
+    With `refresh_after` (a soft TTL, in seconds), entries older than that are still returned right away, while
+    they are recomputed in the background; in `refresh_executor` (a shared thread pool by default), or as an asyncio
+    task for coroutine methods. Entries the cache itself expired (its hard TTL, ie `MemoCache(ttl=...)`) are
+    recomputed inline as usual. Failed refreshes keep serving the stale entry. As refreshes write to the cache from
+    another thread, sync functions without a `lock` get one lock (shared by all of their caches) supplied for them.
+
+    With `stats` (True, a name, or a `MemoStats`), hits, misses, evictions, cached exceptions, compute latencies and
+    the hottest keys are recorded; see `get_stats`. Without it, no instrumentation overhead is incurred.
+
+    With `tags` (a func receiving the method's arguments and returning an iterable of tags, or a fixed iterable of
+    them), entries are cached under those tags; `invalidate_tags` then invalidates all entries of a tag in O(1),
+    dropping them lazily as they are read. See `TagGenerations`; a separate one can be given as `generations`.
+
+    >>> class Tenants(object):
+    ...     def __init__(self):
+    ...         self.cache = MemoCache(maxsize=128)
+    ...     @cachedmethod(lambda self: self.cache, tags=lambda self, tenant, name: ['tenant:%s' % tenant])
+    ...     def setting(self, tenant, name):
+    ...         print('loading %s %s' % (tenant, name))
+    ...         return name.upper()
+    >>> tenants = Tenants()
+    >>> tenants.setting(1, 'a'), tenants.setting(1, 'a')
+    loading 1 a
+    ('A', 'A')
+    >>> invalidate_tags('tenant:1')
+    >>> tenants.setting(1, 'a')
+    loading 1 a
+    'A'
 
     Originally from cachetools, but modified to support caching certain exceptions.
     """
@@ -36,46 +556,25 @@ def cachedmethod(cache, key=_default, lock=None, typed=_default, cached_exceptio
     def decorator(method):
         # pass method to default key function for backwards compatibilty
         if key is _default:
-            makekey = functools.partial(cachetools.typedkey if typed else cachetools.hashkey, method)
+            makekey = functools.partial(cachetools.keys.typedkey if typed else cachetools.keys.hashkey, method)
         else:
             makekey = key  # custom key function always receive method args
 
-        @six.wraps(method)
-        def wrapper(self, *args, **kwargs):
-            c = cache(self)
-            ret = _sentinel
-
-            if c is not None:
-                k = makekey(self, *args, **kwargs)
-                try:
-                    if lock is not None:
-                        with lock(self):
-                            ret = c[k]
-                    else:
-                        ret = c[k]
-                except KeyError:
-                    pass  # key not found
-
-            if ret is _sentinel:
-                try:
-                    ret = method(self, *args, **kwargs)
-                except cached_exception as e:
-                    ret = CachedException(e)
-
-                if c is not None:
-                    try:
-                        if lock is not None:
-                            with lock(self):
-                                c[k] = ret
-                        else:
-                            c[k] = ret
-                    except ValueError:
-                        pass  # value too large
-
-            if isinstance(ret, CachedException):
-                ret()
-            else:
-                return ret
+        wrapper = _memoize(
+            method,
+            get_cache=lambda self, *args, **kwargs: cache(self),
+            makekey=makekey,
+            get_lock=None if lock is None else lambda self, *args, **kwargs: lock(self),
+            cached_exception=cached_exception,
+            exception_ttl=exception_ttl,
+            single_flight=single_flight,
+            refresh_after=refresh_after,
+            refresh_executor=refresh_executor,
+            stats=_resolve_stats(stats, method),
+            exception_policy=exception_policy,
+            tags=tags,
+            generations=generations,
+        )
 
         # deprecated wrapper attribute
         def getter(self):
@@ -88,16 +587,641 @@ def cachedmethod(cache, key=_default, lock=None, typed=_default, cached_exceptio
     return decorator
 
 
-def lazyproperty(fn):
+def acachedmethod(cache, key=_default, lock=None, single_flight=True, **kwargs):
     """
-    Lazy/Cached property.
+    `cachedmethod` for coroutine methods; caches awaited results, sharing one in-flight call per key by default.
+
+    >>> import asyncio
+    >>> class Resolver(object):
+    ...     calls = 0
+    ...     def __init__(self):
+    ...         self.cache = MemoCache(maxsize=128)
+    ...     @acachedmethod(lambda self: self.cache)
+    ...     async def resolve(self, name):
+    ...         self.calls += 1
+    ...         await asyncio.sleep(0.01)
+    ...         return name.upper()
+    >>> async def main(resolver):
+    ...     return await asyncio.gather(*[resolver.resolve('a') for _ in range(5)])
+    >>> resolver = Resolver()
+    >>> asyncio.run(main(resolver)), resolver.calls
+    (['A', 'A', 'A', 'A', 'A'], 1)
+
+    Other kwargs are passed through to `cachedmethod`.
     """
-    attr_name = '_lazy_' + fn.__name__
+    return cachedmethod(cache, key=key, lock=lock, single_flight=single_flight, **kwargs)
 
-    @property
-    def _lazyprop(self):
-        if not hasattr(self, attr_name):
-            setattr(self, attr_name, fn(self))
-        return getattr(self, attr_name)
 
-    return _lazyprop
+def cached(
+        cache,
+        key=cachetools.keys.hashkey,
+        lock=None,
+        cached_exception=None,
+        exception_ttl=None,
+        single_flight=False,
+        refresh_after=None,
+        refresh_executor=None,
+        stats=None,
+        exception_policy=None,
+        tags=None,
+        generations=None,
+):
+    """
+    Decorator to wrap a function (or coroutine function) with a memoizing callable that saves results in `cache`.
+
+    Same as `cachedmethod`, but for plain functions; `cache` is the mapping itself and `lock` a context manager.
+
+    >>> calls = []
+    >>> @cached(MemoCache(maxsize=128), cached_exception=KeyError, exception_ttl=0.05)
+    ... def lookup(name):
+    ...     calls.append(name)
+    ...     return {'a': 1}[name]
+    >>> lookup('a')
+    1
+    >>> lookup('b')
+    Traceback (most recent call last):
+        ...
+    KeyError: 'b'
+
+    The exception is cached, so it's re-raised without calling again until `exception_ttl` passes:
+
+    >>> lookup('b')
+    Traceback (most recent call last):
+        ...
+    KeyError: 'b'
+    >>> calls
+    ['a', 'b']
+    >>> time.sleep(0.06)
+    >>> lookup('b')
+    Traceback (most recent call last):
+        ...
+    KeyError: 'b'
+    >>> calls
+    ['a', 'b', 'b']
+
+    With `refresh_after`, stale entries are served while being recomputed in the background:
+
+    >>> import concurrent.futures
+    >>> executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    >>> versions = iter(range(10))
+    >>> @cached(MemoCache(maxsize=128), refresh_after=0.05, refresh_executor=executor)
+    ... def version():
+    ...     return next(versions)
+    >>> version()
+    0
+    >>> time.sleep(0.06)
+    >>> version()  # Stale, so refreshed in the background meanwhile
+    0
+    >>> executor.shutdown(wait=True)
+    >>> version()
+    1
+
+    >>> policy = ExceptionPolicy(ttls={KeyError: None}, backoff=0.5, max_backoff=60)
+    >>> @cached(MemoCache(maxsize=128), exception_policy=policy)
+    ... def lookup(name):
+    ...     return {'a': 1}[name]
+    >>> lookup('b')
+    Traceback (most recent call last):
+        ...
+    KeyError: 'b'
+    """
+
+    def decorator(func):
+        return _memoize(
+            func,
+            get_cache=lambda *args, **kwargs: cache,
+            makekey=key,
+            get_lock=None if lock is None else lambda *args, **kwargs: lock,
+            cached_exception=cached_exception,
+            exception_ttl=exception_ttl,
+            single_flight=single_flight,
+            refresh_after=refresh_after,
+            refresh_executor=refresh_executor,
+            stats=_resolve_stats(stats, func),
+            exception_policy=exception_policy,
+            tags=tags,
+            generations=generations,
+        )
+
+    return decorator
+
+
+def acached(cache, key=cachetools.keys.hashkey, lock=None, single_flight=True, **kwargs):
+    """
+    `cached` for coroutine functions; caches awaited results, sharing one in-flight call per key by default.
+
+    Other kwargs are passed through to `cached`.
+    """
+    return cached(cache, key=key, lock=lock, single_flight=single_flight, **kwargs)
+
+
+class _Stamped(object):
+    """Cached value along with when it was computed, for `refresh_after`."""
+    __slots__ = ('value', 'stored_at')
+
+    def __init__(self, value):
+        self.value = value
+        self.stored_at = time.time()  # wall clock, like `CachedException.expires`
+
+
+class _Tagged(object):
+    """Cached value along with the generations of its tags when it was computed, for `tags`."""
+    __slots__ = ('value', 'stamps')
+
+    def __init__(self, value, stamps):
+        self.value = value
+        self.stamps = stamps
+
+
+def _put(cache, key, value):
+    cache[key] = value
+    return 0
+
+
+def _put_counting_evictions(cache, key, value):
+    """Store `value` under `key`, returning how many entries were evicted to make room for it."""
+    counter = getattr(cache, 'evictions', None)
+    if counter is not None:
+        # Caches keeping their own count (`MemoCache`, `DiskCache`) spare us sizing them, which for `DiskCache` is a
+        # `COUNT(*)` query
+        cache[key] = value
+        return cache.evictions - counter
+
+    size = len(cache)
+    # Replacing an entry does not grow the cache, so the shrink is all evictions
+    grown = 0 if key in cache else 1
+    cache[key] = value
+    return size + grown - len(cache)
+
+
+class TagGenerations(object):
+    """
+    Generation counter per tag, to invalidate all entries cached under a tag at once; see `tags` in `cachedmethod`.
+
+    Entries remember the generation of each of their tags when computed, and are treated as missing (and dropped) when
+    read after any of them moved on, so invalidating a tag is O(1) no matter how many entries it covers.
+
+    >>> generations = TagGenerations()
+    >>> stamps = generations.stamp(['tenant:1'])
+    >>> generations.valid(stamps)
+    True
+    >>> generations.invalidate('tenant:1')
+    >>> generations.valid(stamps)
+    False
+    """
+
+    def __init__(self):
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<%s tags=%d>' % (self.__class__.__name__, len(self._generations))
+
+    def generation(self, tag):
+        return self._generations.get(tag, 0)
+
+    def stamp(self, tags):
+        """
+        :param iterable tags: Tags
+        :return tuple: ((tag, current generation), ...) to check with `valid` later
+        """
+        get = self._generations.get
+        return tuple((tag, get(tag, 0)) for tag in tags)
+
+    def valid(self, stamps):
+        """
+        :param tuple stamps: As returned by `stamp`
+        :return bool: Whether none of the tags were invalidated since
+        """
+        get = self._generations.get
+        for tag, generation in stamps:
+            if get(tag, 0) != generation:
+                return False
+        return True
+
+    def invalidate(self, *tags):
+        """
+        Invalidate every entry cached under any of `tags`.
+        """
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+
+
+default_generations = TagGenerations()
+
+
+def invalidate_tags(*tags, generations=None):
+    """
+    Invalidate every entry cached under any of `tags`, in `default_generations` unless `generations` is given.
+    """
+    (generations or default_generations).invalidate(*tags)
+
+
+_default_refresh_executor = None
+_default_refresh_executor_lock = threading.Lock()
+
+
+def _get_default_refresh_executor():
+    global _default_refresh_executor
+    with _default_refresh_executor_lock:
+        if _default_refresh_executor is None:
+            import concurrent.futures
+            _default_refresh_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix='memo-refresh'
+            )
+        return _default_refresh_executor
+
+
+def _memoize(
+        func,
+        get_cache,
+        makekey,
+        get_lock,
+        cached_exception,
+        exception_ttl,
+        single_flight,
+        refresh_after=None,
+        refresh_executor=None,
+        stats=None,
+        exception_policy=None,
+        tags=None,
+        generations=None,
+):
+    """
+    Build the memoizing wrapper behind `cachedmethod` and `cached`.
+
+    `get_cache`, `makekey` and `get_lock` are all called with the wrapped call's arguments.
+    """
+    is_coroutine = inspect.iscoroutinefunction(func)
+
+    policy = exception_policy
+    if cached_exception is None and policy is not None:
+        cached_exception = policy.exceptions or None
+
+    flight = None
+    if single_flight:
+        flight = AsyncSingleFlight() if is_coroutine else SingleFlight()
+
+    refreshing = set()
+    refreshing_lock = threading.Lock()
+
+    if refresh_after is not None and get_lock is None and not is_coroutine:
+        # Background refreshes write to the cache from the executor's threads, and caches are not thread safe
+        refresh_cache_lock = threading.RLock()
+
+        def get_lock(*args, **kwargs):
+            return refresh_cache_lock
+
+    if tags is not None:
+        if generations is None:
+            generations = default_generations
+        if not callable(tags):
+            static_tags = tuple(tags)
+
+            def tags(*args, **kwargs):
+                return static_tags
+
+    def stamp_tags(args, kwargs):
+        return generations.stamp(tags(*args, **kwargs)) if tags is not None else None
+
+    def drop(c, k, lk, entry):
+        try:
+            if lk is not None:
+                with lk:
+                    if c.get(k) is entry:
+                        del c[k]
+            elif c.get(k) is entry:
+                del c[k]
+        except KeyError:
+            pass
+
+    def lookup(c, k, lk):
+        """Return (cached value or _sentinel, whether it's due for a refresh)."""
+        try:
+            if lk is not None:
+                with lk:
+                    ret = c[k]
+            else:
+                ret = c[k]
+        except KeyError:
+            return _sentinel, False  # key not found
+
+        if isinstance(ret, _Tagged):
+            if not generations.valid(ret.stamps):
+                drop(c, k, lk, ret)
+                return _sentinel, False
+            ret = ret.value
+
+        stale = False
+        if isinstance(ret, _Stamped):
+            stale = refresh_after is not None and time.time() - ret.stored_at >= refresh_after
+            ret = ret.value
+
+        if isinstance(ret, CachedException) and ret.expired():
+            return _sentinel, False
+        return ret, stale
+
+    def store(c, k, lk, ret, stamps=None):
+        value = ret
+        if refresh_after is not None:
+            ret = _Stamped(ret)
+        if stamps is not None:
+            ret = _Tagged(ret, stamps)
+        put = _put_counting_evictions if stats is not None else _put
+        try:
+            if lk is not None:
+                with lk:
+                    evicted = put(c, k, ret)
+            else:
+                evicted = put(c, k, ret)
+        except ValueError:
+            return  # value too large
+
+        if policy is not None and not isinstance(value, CachedException):
+            policy.forget(c, k)
+
+        if evicted > 0:
+            stats.record_evictions(evicted)
+
+    def wrap_exception(c, k, lk, e):
+        if policy is not None and c is not None:
+            return policy.wrap(c, k, e, lock=lk)
+        return CachedException(e, ttl=exception_ttl)
+
+    def unwrap(ret):
+        if isinstance(ret, CachedException):
+            ret()
+        else:
+            return ret
+
+    def compute(c, k, lk, args, kwargs):
+        if flight is not None:
+            # Someone else may have finished computing this between our miss and us taking the lead
+            ret, _ = lookup(c, k, lk)
+            if ret is not _sentinel:
+                return ret
+
+        stamps = stamp_tags(args, kwargs)
+        started = time.perf_counter() if stats is not None else 0
+        try:
+            ret = func(*args, **kwargs)
+        except (cached_exception or ()) as e:
+            ret = wrap_exception(c, k, lk, e)
+        if stats is not None:
+            stats.record_compute(time.perf_counter() - started, isinstance(ret, CachedException))
+
+        if c is not None:
+            store(c, k, lk, ret, stamps)
+        return ret
+
+    async def acompute(c, k, lk, args, kwargs):
+        if flight is not None:
+            ret, _ = lookup(c, k, lk)
+            if ret is not _sentinel:
+                return ret
+
+        stamps = stamp_tags(args, kwargs)
+        started = time.perf_counter() if stats is not None else 0
+        try:
+            ret = await func(*args, **kwargs)
+        except (cached_exception or ()) as e:
+            ret = wrap_exception(c, k, lk, e)
+        if stats is not None:
+            stats.record_compute(time.perf_counter() - started, isinstance(ret, CachedException))
+
+        if c is not None:
+            store(c, k, lk, ret, stamps)
+        return ret
+
+    def refresh(c, k, lk, args, kwargs):
+        try:
+            stamps = stamp_tags(args, kwargs)
+            store(c, k, lk, func(*args, **kwargs), stamps)
+        except Exception:
+            _LOG.exception('Background refresh of %s failed; serving the stale entry.', func.__name__)
+
+    async def arefresh(c, k, lk, args, kwargs):
+        try:
+            stamps = stamp_tags(args, kwargs)
+            store(c, k, lk, await func(*args, **kwargs), stamps)
+        except Exception:
+            _LOG.exception('Background refresh of %s failed; serving the stale entry.', func.__name__)
+
+    def schedule_refresh(c, k, lk, args, kwargs):
+        refresh_key = (id(c), k)
+        with refreshing_lock:
+            if refresh_key in refreshing:
+                return  # already on it
+            refreshing.add(refresh_key)
+
+        def done(_):
+            with refreshing_lock:
+                refreshing.discard(refresh_key)
+
+        if is_coroutine:
+            future = asyncio.ensure_future(arefresh(c, k, lk, args, kwargs))
+        else:
+            executor = refresh_executor or _get_default_refresh_executor()
+            future = executor.submit(refresh, c, k, lk, args, kwargs)
+        future.add_done_callback(done)
+
+    def prepare(args, kwargs):
+        c = get_cache(*args, **kwargs)
+        k = lk = None
+        ret = _sentinel
+
+        if c is not None:
+            k = makekey(*args, **kwargs)
+            lk = get_lock(*args, **kwargs) if get_lock is not None else None
+            ret, stale = lookup(c, k, lk)
+            if stale:
+                schedule_refresh(c, k, lk, args, kwargs)
+
+            if stats is not None:
+                if ret is _sentinel:
+                    stats.record_miss(k)
+                else:
+                    stats.record_hit(k)
+
+        return c, k, lk, ret
+
+    if is_coroutine:
+
+        @six.wraps(func)
+        async def wrapper(*args, **kwargs):
+            c, k, lk, ret = prepare(args, kwargs)
+
+            if ret is _sentinel:
+                if flight is not None and c is not None:
+                    ret = await flight.do((id(c), k), acompute, c, k, lk, args, kwargs)
+                else:
+                    ret = await acompute(c, k, lk, args, kwargs)
+
+            return unwrap(ret)
+
+    else:
+
+        @six.wraps(func)
+        def wrapper(*args, **kwargs):
+            c, k, lk, ret = prepare(args, kwargs)
+
+            if ret is _sentinel:
+                if flight is not None and c is not None:
+                    ret = flight.do((id(c), k), compute, c, k, lk, args, kwargs)
+                else:
+                    ret = compute(c, k, lk, args, kwargs)
+
+            return unwrap(ret)
+
+    return wrapper
+
+
+def instance_cache(factory, attr_name=None):
+    """
+    Build a `cache` callable for `cachedmethod` that lazily gives each instance its own cache made by `factory`.
+
+    :param callable factory: Returns a new cache mapping, ie `lambda: MemoCache(maxsize=128)`
+    :param str attr_name: Instance attribute to keep the cache in. Defaults to a unique one per call.
+    :return callable: Func of `self` returning that instance's cache
+    """
+    if attr_name is None:
+        attr_name = '_instance_cache_%x' % id(factory)
+
+    def cache(self):
+        try:
+            return self.__dict__[attr_name]
+        except KeyError:
+            c = self.__dict__[attr_name] = factory()
+            return c
+
+    return cache
+
+
+class _LazyProperty(object):
+    """
+    Non-data descriptor behind `lazyproperty`.
+    """
+
+    # Locks are striped by instance rather than kept on it, so instances stay picklable and copyable
+    lock_stripes = 16
+
+    def __init__(self, fn, lock=False):
+        self.fn = fn
+        self.lock = lock
+        self._locks = [threading.RLock() for _ in range(self.lock_stripes)] if lock else None
+        self.__doc__ = fn.__doc__
+        self.__set_name__(None, fn.__name__)
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot_name = '_lazy_' + name
+
+    def _instance_lock(self, instance):
+        return self._locks[id(instance) % len(self._locks)]
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        # Lookups bypass `getattr`, which would fall back on the class' `__getattr__` rather than tell us it's unset
+        if type(instance).__dictoffset__:
+            # Only reached on first access; afterwards the instance `__dict__` shadows us.
+            values = instance.__dict__
+            if not self.lock:
+                value = values[self.name] = self.fn(instance)
+                return value
+
+            with self._instance_lock(instance):
+                try:
+                    return values[self.name]
+                except KeyError:
+                    pass
+                value = values[self.name] = self.fn(instance)
+                return value
+
+        try:
+            return object.__getattribute__(instance, self.slot_name)
+        except AttributeError:
+            pass
+
+        if not self.lock:
+            return self._store_slot(instance, self.fn(instance))
+
+        with self._instance_lock(instance):
+            try:
+                return object.__getattribute__(instance, self.slot_name)
+            except AttributeError:
+                pass
+            return self._store_slot(instance, self.fn(instance))
+
+    def _store_slot(self, instance, value):
+        setattr(instance, self.slot_name, value)
+        return value
+
+
+def lazyproperty(fn=None, lock=False):
+    """
+    Lazy/Cached property.
+
+    Computed on first access and then stored in the instance `__dict__` under the same name, so later reads are plain
+    attribute hits. Delete the attribute to have it recomputed.
+
+    Classes using `__slots__` must reserve a `_lazy_<name>` slot for it to be stored in instead.
+
+    >>> class Thing(object):
+    ...     @lazyproperty
+    ...     def value(self):
+    ...         print('computing')
+    ...         return 42
+    >>> thing = Thing()
+    >>> thing.value
+    computing
+    42
+    >>> thing.value
+    42
+
+    >>> class Slotted(object):
+    ...     __slots__ = ('_lazy_value', )
+    ...     @lazyproperty(lock=True)
+    ...     def value(self):
+    ...         print('computing')
+    ...         return 42
+    >>> slotted = Slotted()
+    >>> slotted.value
+    computing
+    42
+    >>> slotted.value
+    42
+
+    >>> class Guarded(object):
+    ...     @lazyproperty(lock=True)
+    ...     def value(self):
+    ...         return 42
+    ...     @lazyproperty(lock=True)
+    ...     def lock(self):
+    ...         return 'computed'
+    >>> guarded = Guarded()
+    >>> guarded.value, guarded.lock
+    (42, 'computed')
+    >>> import copy
+    >>> copy.deepcopy(guarded).__dict__ == guarded.__dict__
+    True
+
+    >>> class Fallback(object):
+    ...     def __getattr__(self, name):
+    ...         return 'fallback'
+    ...     @lazyproperty
+    ...     def value(self):
+    ...         return 42
+    >>> Fallback().value
+    42
+
+    :param callable fn: Method to compute the value with
+    :param bool lock: If Truthy, concurrent first accesses from several threads compute the value only once. Uses a
+                      set of locks per property, striped by instance.
+    :return _LazyProperty: Descriptor
+    """
+    if fn is None:
+        return functools.partial(lazyproperty, lock=lock)
+    return _LazyProperty(fn, lock=lock)
@@ -3,12 +3,18 @@ try:
 except ImportError:
     from collections import MutableSet
 
+import array
 import collections
 import copy
+import hashlib
+import io
+import math
+import pickle
 import random
 import time
 
 import attr
+import six
 
 from .iters import consume
 
@@ -64,3 +70,531 @@ class TimedValueSet(MetaSet):
     @property
     def added_at(self):
         return self._meta
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value):
+    """Spread `hash(value)` over 64 bits (splitmix64 finalizer); small int hashes are otherwise just themselves."""
+    x = hash(value) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94d049bb133111eb) & _MASK64
+    return x ^ (x >> 31)
+
+
+@attr.s
+class TTLSet(MutableSet):
+    """
+    Set that forgets values once they are older than `ttl` seconds, or once more than `maxlen` newer values were added.
+
+    Expiry is done lazily on access, oldest first, so each operation is amortized O(1).
+
+    >>> now = [0]
+    >>> s = TTLSet(ttl=10, timer=lambda: now[0])
+    >>> s.add('a')
+    >>> 'a' in s
+    True
+    >>> now[0] = 11
+    >>> 'a' in s
+    False
+
+    >>> s = TTLSet(maxlen=2)
+    >>> s |= ['a', 'b', 'c']
+    >>> sorted(s)
+    ['b', 'c']
+    """
+
+    ttl = attr.ib(default=None)  # type: float
+    maxlen = attr.ib(default=None)  # type: int
+    timer = attr.ib(default=time.time)  # type: callable
+
+    _store = attr.ib(factory=collections.OrderedDict)  # type: collections.OrderedDict
+
+    def _expire(self):
+        store = self._store
+
+        if self.maxlen is not None:
+            while len(store) > self.maxlen:
+                store.popitem(last=False)
+
+        if self.ttl is not None and store:
+            cutoff = self.timer() - self.ttl
+            while store:
+                value, added_at = next(iter(store.items()))
+                if added_at > cutoff:
+                    break
+                del store[value]
+
+    def __contains__(self, item):
+        self._expire()
+        return item in self._store
+
+    def __iter__(self):
+        self._expire()
+        return iter(list(self._store))
+
+    def __len__(self):
+        self._expire()
+        return len(self._store)
+
+    def add(self, value):
+        store = self._store
+        store.pop(value, None)
+        store[value] = self.timer()
+        self._expire()
+
+    def discard(self, value):
+        self._store.pop(value, None)
+
+
+@attr.s
+class BloomFilter(object):
+    """
+    Bloom filter; a set-like membership test in fixed memory, at the cost of `error_rate` false positives.
+
+    Values can not be removed or iterated over. Memory use is about 1.2 bytes per `capacity` at a 1% error rate.
+
+    >>> bf = BloomFilter(capacity=1000, error_rate=0.01)
+    >>> bf.add('a')
+    >>> 'a' in bf, 'b' in bf
+    (True, False)
+    >>> len(bf)
+    1
+    """
+
+    capacity = attr.ib(default=1000000)  # type: int
+    error_rate = attr.ib(default=0.001)  # type: float
+
+    def __attrs_post_init__(self):
+        if not 0 < self.error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1: %r' % self.error_rate)
+
+        self.num_bits = max(8, int(math.ceil(-self.capacity * math.log(self.error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / float(self.capacity) * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def _positions(self, value):
+        # Kirsch-Mitzenmacher double hashing: k positions out of two 32bit halves of one hash
+        x = _mix64(value)
+        h1, h2 = x & 0xffffffff, (x >> 32) | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, item):
+        bits = self._bits
+        for pos in self._positions(item):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, value):
+        bits = self._bits
+        added = False
+        for pos in self._positions(value):
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                added = True
+        if added:
+            self._count += 1
+
+    def __len__(self):
+        """Approximate number of distinct values added."""
+        return self._count
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
+
+
+@attr.s
+class CountMinSketch(object):
+    """
+    Count-min sketch; approximate counts of many distinct values in fixed memory. Estimates never undercount.
+
+    >>> cms = CountMinSketch(width=1024, depth=4)
+    >>> for value in 'abracadabra':
+    ...     _ = cms.add(value)
+    >>> cms['a'], cms['b'], cms['z']
+    (5, 2, 0)
+    """
+
+    width = attr.ib(default=2048)  # type: int
+    depth = attr.ib(default=4)  # type: int
+
+    def __attrs_post_init__(self):
+        self._rows = [[0] * self.width for _ in range(self.depth)]
+        self.total = 0
+
+    def _indexes(self, value):
+        x = _mix64(value)
+        h1, h2 = x & 0xffffffff, (x >> 32) | 1
+        width = self.width
+        return [(h1 + i * h2) % width for i in range(self.depth)]
+
+    def add(self, value, count=1):
+        """
+        Count `value` `count` more times.
+
+        :return int: New estimated count of `value`
+        """
+        self.total += count
+        estimate = None
+        for row, i in zip(self._rows, self._indexes(value)):
+            row[i] += count
+            if estimate is None or row[i] < estimate:
+                estimate = row[i]
+        return estimate
+
+    def __getitem__(self, value):
+        return min(row[i] for row, i in zip(self._rows, self._indexes(value)))
+
+
+class CuckooFilterFull(Exception):
+    """Raised when a value can not be placed in a `CuckooFilter`; it needs a bigger capacity."""
+
+
+@attr.s
+class CuckooFilter(object):
+    """
+    Cuckoo filter; like `BloomFilter`, but supports removing values and uses less memory at low error rates.
+
+    Stores 16bit fingerprints in buckets of `bucket_size`, so the error rate is about `2 * bucket_size / 2**16`.
+
+    >>> cf = CuckooFilter(capacity=1000)
+    >>> cf.add('a')
+    >>> 'a' in cf, 'b' in cf
+    (True, False)
+    >>> cf.discard('a')
+    >>> 'a' in cf
+    False
+    """
+
+    capacity = attr.ib(default=1000000)  # type: int
+    bucket_size = attr.ib(default=4)  # type: int
+    max_kicks = attr.ib(default=500)  # type: int
+
+    def __attrs_post_init__(self):
+        # Bucket count has to be a power of two for the xor trick in `_alt_index` to be reversible
+        num_buckets = 1
+        while num_buckets * self.bucket_size < self.capacity / 0.95:
+            num_buckets <<= 1
+        self.num_buckets = num_buckets
+
+        self._slots = array.array('H', bytes(2 * num_buckets * self.bucket_size))
+        self._count = 0
+
+    def _fingerprint(self, value):
+        x = _mix64(value)
+        # 0 marks an empty slot, so never use it as a fingerprint
+        return (x & 0xffff) or 1, (x >> 16) & (self.num_buckets - 1)
+
+    def _alt_index(self, index, fingerprint):
+        return (index ^ (_mix64(fingerprint) & (self.num_buckets - 1))) & (self.num_buckets - 1)
+
+    def _bucket(self, index):
+        start = index * self.bucket_size
+        return range(start, start + self.bucket_size)
+
+    def _find(self, fingerprint, i1, i2):
+        slots = self._slots
+        for index in (i1, i2):
+            for slot in self._bucket(index):
+                if slots[slot] == fingerprint:
+                    return slot
+        return None
+
+    def __contains__(self, item):
+        fingerprint, i1 = self._fingerprint(item)
+        return self._find(fingerprint, i1, self._alt_index(i1, fingerprint)) is not None
+
+    def _insert_into(self, index, fingerprint):
+        slots = self._slots
+        for slot in self._bucket(index):
+            if not slots[slot]:
+                slots[slot] = fingerprint
+                return True
+        return False
+
+    def add(self, value):
+        fingerprint, i1 = self._fingerprint(value)
+        i2 = self._alt_index(i1, fingerprint)
+
+        if self._find(fingerprint, i1, i2) is not None:
+            return
+
+        if self._insert_into(i1, fingerprint) or self._insert_into(i2, fingerprint):
+            self._count += 1
+            return
+
+        # Evict residents to their alternate bucket until everyone has a home
+        slots = self._slots
+        index = random.choice((i1, i2))
+        evicted = []
+        for _ in range(self.max_kicks):
+            slot = random.choice(self._bucket(index))
+            fingerprint, slots[slot] = slots[slot], fingerprint
+            evicted.append(slot)
+
+            index = self._alt_index(index, fingerprint)
+            if self._insert_into(index, fingerprint):
+                self._count += 1
+                return
+
+        # Put everything back where it was so the filter is left untouched
+        for slot in reversed(evicted):
+            fingerprint, slots[slot] = slots[slot], fingerprint
+        raise CuckooFilterFull('CuckooFilter is full at %d values (capacity=%d)' % (self._count, self.capacity))
+
+    def discard(self, value):
+        fingerprint, i1 = self._fingerprint(value)
+        slot = self._find(fingerprint, i1, self._alt_index(i1, fingerprint))
+        if slot is not None:
+            self._slots[slot] = 0
+            self._count -= 1
+
+    remove = discard
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return self._slots.itemsize * len(self._slots)
+
+
+class _SortedFrozenset(object):
+    """Pickles as a `frozenset` built from its items in a fixed order, rather than in (per process) hash order."""
+    __slots__ = ('items', )
+
+    def __init__(self, items):
+        self.items = items
+
+    def __reduce__(self):
+        return frozenset, (self.items, )
+
+
+def _canonical(value):
+    """Rebuild `value` out of the representatives of what it compares equal to, ie `1` for `True` and `1.0`."""
+    kind = type(value)
+    if kind is tuple:
+        return tuple(_canonical(item) for item in value)
+    if kind is bool or kind is float and value.is_integer():
+        return int(value)
+    if kind is frozenset:
+        return _SortedFrozenset(tuple(sorted(
+            (_canonical(item) for item in value), key=lambda item: canonical_dumps(item, protocol=2)
+        )))
+    return value
+
+
+def canonical_dumps(value, protocol=2):
+    """
+    Pickle `value` so that equal values give equal bytes, in every process.
+
+    Plain pickles are not: they refer back to objects seen before by identity, carry `1` and `1.0` as distinct, and
+    lay out sets in hash order. Tuples, frozensets, bools and integral floats are normalized (recursively), and
+    anything else is pickled as is, so it should pickle canonically itself.
+
+    >>> x = 'ab'
+    >>> canonical_dumps((x, x)) == canonical_dumps((x, ''.join(['a', 'b'])))
+    True
+    >>> canonical_dumps((1, True)) == canonical_dumps((1.0, 1))
+    True
+    >>> pickle.loads(canonical_dumps((1.5, frozenset(['a', 'b'])))) == (1.5, frozenset(['a', 'b']))
+    True
+
+    :param object value: Value to pickle
+    :param int protocol: Pickle protocol
+    :return bytes: Pickle
+    """
+    buf = io.BytesIO()
+    pickler = pickle.Pickler(buf, protocol=protocol)
+    # No memo, so repeated objects are written out in full each time (values are hashable, so not self-referencing)
+    pickler.fast = True
+    pickler.dump(_canonical(value))
+    return buf.getvalue()
+
+
+def stable_hash(value):
+    """
+    64bit hash of `value` that is the same in every process, unlike `hash` for str/bytes (see PYTHONHASHSEED).
+
+    Values comparing equal hash the same, as with `hash`.
+
+    >>> stable_hash('a') == stable_hash('a'), stable_hash(1) == stable_hash(2)
+    (True, False)
+    >>> stable_hash(1) == stable_hash(1.0), stable_hash((1, 'a')) == stable_hash((1.0, ''.join(['a'])))
+    (True, True)
+
+    :param int|str|bytes|object value: Value to hash; anything else than int/str/bytes goes through `canonical_dumps`
+    :return int: Hash
+    """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, six.integer_types):
+        return _mix64(value & _MASK64)
+    if isinstance(value, six.text_type):
+        value = value.encode('utf-8')
+    elif not isinstance(value, (bytes, bytearray, memoryview)):
+        value = canonical_dumps(value)
+    return int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'little')
+
+
+class SharedMemorySetFull(Exception):
+    """Raised when a `SharedMemorySet` shard has no free slots left; it needs a bigger capacity."""
+
+
+class SharedMemorySet(object):
+    """
+    Set of 64bit fingerprints in `multiprocessing.shared_memory`, shared by every process it's handed to.
+
+    The table is split into `num_locks` shards, each an open addressing (linear probing) hash table guarded by its
+    own lock, so processes only contend when they touch the same shard. `add_if_absent` is an atomic
+    check-and-insert, which `pytutils.iters.dedupe_iter` uses when available.
+
+    Values are reduced to a fingerprint with `stable_hash`, so false positives are possible at a rate of about
+    `len(self) / 2**64`. Pass it to workers as `multiprocessing.Process` args or a `Pool` initializer (the locks can
+    not travel over a pool's task queue). The creating process should `unlink` it once everyone is done.
+
+    >>> s = SharedMemorySet(capacity=1000)
+    >>> s.add_if_absent('a'), s.add_if_absent('a'), 'a' in s, 'b' in s, len(s)
+    (True, False, True, False, 1)
+
+    Shards fill up unevenly, so each is sized with headroom; `capacity` values always fit:
+
+    >>> all(s.add_if_absent('value %d' % i) for i in range(999)), len(s)
+    (True, 1000)
+    >>> s.unlink()
+    """
+
+    # Load a shard is sized to stay under (with headroom for uneven hashing); keeps probe sequences short
+    max_load = 0.7
+
+    def __init__(self, capacity=1000000, num_locks=64, name=None, locks=None, context=None):
+        """
+        :param int capacity: Number of values to make room for.
+        :param int num_locks: Number of shards, each with its own lock.
+        :param str name: Shared memory block name to attach to. A new block is created if not given.
+        :param list locks: `multiprocessing.Lock`s to use when attaching, one per shard.
+        :param multiprocessing.context.BaseContext context: Context to create locks with, ie
+                                                            `multiprocessing.get_context('spawn')`.
+        """
+        from multiprocessing import shared_memory
+        import multiprocessing
+
+        self.capacity = capacity
+        self.num_locks = num_locks
+
+        # Values spread over shards binomially, so size for four standard deviations above the average shard load.
+        # Shards may still fill up past `max_load` (all but one slot, so probes end), which keeps `capacity` a promise.
+        expected = capacity / num_locks
+        needed = expected + 4 * math.sqrt(expected) + 1
+        shard_slots = 8
+        while shard_slots * self.max_load < needed:
+            shard_slots <<= 1
+        self.shard_slots = shard_slots
+
+        # Layout: [count per shard] [shard 0 slots] [shard 1 slots] ...
+        size = 8 * (num_locks + num_locks * shard_slots)
+
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+            context = context or multiprocessing
+            locks = [context.Lock() for _ in range(num_locks)]
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+            if locks is None:
+                raise ValueError('Attaching to an existing SharedMemorySet requires its locks.')
+
+        self.name = self._shm.name
+        self._locks = locks
+        self._words = self._shm.buf.cast('Q')
+
+    def __getstate__(self):
+        return dict(capacity=self.capacity, num_locks=self.num_locks, name=self.name, locks=self._locks)
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __repr__(self):
+        return '<%s name=%r len=%d capacity=%d>' % (self.__class__.__name__, self.name, len(self), self.capacity)
+
+    def _locate(self, value):
+        fingerprint = stable_hash(value) or 1  # 0 marks an empty slot
+        shard = fingerprint % self.num_locks
+        home = (fingerprint >> 16) & (self.shard_slots - 1)
+        return fingerprint, shard, home
+
+    def _probe(self, fingerprint, shard, home):
+        """Return (found, slot offset); the offset is the first empty one if not found. Call with the shard locked."""
+        words = self._words
+        base = self.num_locks + shard * self.shard_slots
+        mask = self.shard_slots - 1
+
+        for i in range(self.shard_slots):
+            offset = base + ((home + i) & mask)
+            current = words[offset]
+            if current == fingerprint:
+                return True, offset
+            if not current:
+                return False, offset
+
+        return False, None
+
+    def __contains__(self, item):
+        fingerprint, shard, home = self._locate(item)
+        with self._locks[shard]:
+            return self._probe(fingerprint, shard, home)[0]
+
+    def add_if_absent(self, value):
+        """
+        Atomically add `value` unless it's already present.
+
+        :return bool: True if it was added, False if it was already there.
+        """
+        fingerprint, shard, home = self._locate(value)
+        words = self._words
+
+        with self._locks[shard]:
+            found, offset = self._probe(fingerprint, shard, home)
+            if found:
+                return False
+
+            if offset is None or words[shard] + 1 >= self.shard_slots:
+                raise SharedMemorySetFull(
+                    'SharedMemorySet shard %d is full (capacity=%d, num_locks=%d)' %
+                    (shard, self.capacity, self.num_locks)
+                )
+
+            words[offset] = fingerprint
+            words[shard] += 1
+            return True
+
+    def add(self, value):
+        self.add_if_absent(value)
+
+    def __len__(self):
+        return sum(self._words[:self.num_locks])
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Detach from the shared memory block in this process."""
+        if getattr(self, '_words', None) is not None:
+            self._words.release()
+            self._words = None
+        self._shm.close()
+
+    def unlink(self):
+        """Detach and destroy the shared memory block; call once from the creating process."""
+        self.close()
+        self._shm.unlink()
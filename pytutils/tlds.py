@@ -1,13 +1,19 @@
+import threading
+
 import cachetools
 
 from .pythree import ensure_decoded_text
 from .iters import accumulate
+from .memo import cached
 
-_ttl_cache = lambda *args, **kwargs: cachetools.TTLCache(maxsize=1024, ttl=600)
+# Entries are served for up to `ttl` seconds; past `_REFRESH_AFTER` they are recomputed in the background meanwhile.
+_ttl_cache = cachetools.TTLCache(maxsize=1024, ttl=600)
+_REFRESH_AFTER = 300
+_ttl_cache_lock = threading.Lock()
 _tldex = None
 
 # This is cached because tldextract is SLOW
-@cachetools.cachedmethod(_ttl_cache)
+@cached(_ttl_cache, lock=_ttl_cache_lock, refresh_after=_REFRESH_AFTER)
 def split_domain_into_subdomains(domain, split_tld=False):
     """
     Walks up a domain by subdomain.
@@ -55,3 +61,16 @@ def split_domain_into_subdomains(domain, split_tld=False):
     domains.reverse()
 
     return domains
+
+
+def split_domain_into_subdomains_with_stats(stats=True):
+    """
+    Instrumented version of `split_domain_into_subdomains`, sharing its cache; stats are opt-in as they cost a little
+    on every call.
+
+    :param bool|str|pytutils.memo.MemoStats stats: See `stats` in `pytutils.memo.cached`
+    :return callable: `split_domain_into_subdomains` recording to `stats`
+    """
+    return cached(_ttl_cache, lock=_ttl_cache_lock, refresh_after=_REFRESH_AFTER, stats=stats)(
+        split_domain_into_subdomains.__wrapped__
+    )
@@ -1,6 +1,88 @@
+import bisect
 import collections
+import fnmatch
+import functools
+import re
+import struct
+import sys
+import threading
+
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
 
 _sentinel = object()
+_missing = object()
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_path(key):
+    """
+    Split a ':' delimited key into a tuple of interned segments.
+
+    Cached, as the same keys tend to be looked up over and over.
+
+    >>> compile_path('a:b:c')
+    ('a', 'b', 'c')
+
+    Arguments:
+        key str|unicode: Key to split
+
+    Returns:
+        tuple: Path segments
+    """
+    return tuple(sys.intern(segment) for segment in key.split(':'))
+
+
+@functools.lru_cache(maxsize=4096)
+def _namespaced(namespace, key):
+    return sys.intern('%s:%s' % (namespace, key)) if namespace else key
+
+
+def _as_path(key):
+    if isinstance(key, str):
+        return compile_path(key)
+    return tuple(key)
+
+
+def _child(node, segment):
+    if isinstance(node, dict):
+        # Neither vivifies defaultdicts nor goes through `Tree.__getitem__`'s namespacing
+        child = dict.get(node, segment, _sentinel)
+        if child is _sentinel:
+            raise KeyError(segment)
+        return child
+
+    if isinstance(node, _Node):
+        child = node.find(segment)
+        if child is _sentinel:
+            raise KeyError(segment)
+        return child
+
+    try:
+        return node[segment]
+    except (TypeError, IndexError):
+        raise KeyError(segment)  # ie a leaf value in the way
+
+
+def _vivify(node, segment):
+    try:
+        return _child(node, segment)
+    except KeyError:
+        if isinstance(node, Tree):
+            return node._make_child(segment)
+
+        factory = getattr(node, 'default_factory', None)
+        if factory is None:
+            raise
+
+        child = factory()
+        if isinstance(node, dict):
+            dict.__setitem__(node, segment, child)
+        else:
+            node[segment] = child
+        return child
 
 
 def get_tree_node(mapping, key, default=_sentinel, parent=False):
@@ -8,31 +90,35 @@ def get_tree_node(mapping, key, default=_sentinel, parent=False):
     Fetch arbitrary node from a tree-like mapping structure with traversal help:
     Dimension can be specified via ':'
 
+    >>> get_tree_node({'a': {'b': 1}}, 'a:b')
+    1
+    >>> get_tree_node({'a': {'b': 1}}, 'a:c', default=None) is None
+    True
+
     Arguments:
         mapping collections.Mapping: Mapping to fetch from
-        key str|unicode: Key to lookup, allowing for : notation
+        key str|unicode|tuple: Key to lookup, allowing for : notation, or a path tuple
         default object: Default value. If set to `:module:_sentinel`, raise KeyError if not found.
         parent bool: If True, return parent node. Defaults to False.
 
     Returns:
         object: Value at specified key
     """
-    key = key.split(':')
-    if parent:
-        key = key[:-1]
+    if isinstance(mapping, (Tree, CompactTree, TreeSnapshot, PersistentTree, MappedTree)) and isinstance(key, str):
+        return mapping._get_path(key, default=default, parent=parent)
 
-    # TODO Unlist my shit. Stop calling me please.
+    path = _as_path(key)
+    if parent:
+        path = path[:-1]
 
     node = mapping
-    for node in key.split(':'):
-        try:
-            node = node[node]
-        except KeyError as exc:
-            node = default
-            break
-
-    if node is _sentinel:
-        raise exc
+    try:
+        for segment in path:
+            node = _child(node, segment)
+    except KeyError:
+        if default is _sentinel:
+            raise
+        return default
     return node
 
 
@@ -40,20 +126,193 @@ def set_tree_node(mapping, key, value):
     """
     Set arbitrary node on a tree-like mapping structure, allowing for : notation to signify dimension.
 
+    Missing intermediate nodes are created when the mapping (or its nodes) are defaultdicts, ie `tree` or `Tree`.
+
+    >>> t = tree()
+    >>> _ = set_tree_node(t, 'a:b', 1)
+    >>> get_tree_node(t, 'a:b')
+    1
+
     Arguments:
         mapping collections.Mapping: Mapping to fetch from
-        key str|unicode: Key to set, allowing for : notation
+        key str|unicode|tuple: Key to set, allowing for : notation, or a path tuple
         value str|unicode: Value to set `key` to
-        parent bool: If True, return parent node. Defaults to False.
 
     Returns:
         object: Parent node.
 
     """
-    basename, dirname = key.rsplit(':', 2)
-    parent_node = get_tree_node(mapping, dirname)
-    parent_node[basename] = value
-    return parent_node
+    if isinstance(mapping, (Tree, CompactTree, PersistentTree)) and isinstance(key, str):
+        return mapping._set_path(key, value)
+
+    path = _as_path(key)
+    node = mapping
+    for segment in path[:-1]:
+        node = _vivify(node, segment)
+
+    if isinstance(node, Tree):
+        node._assign(path[-1], value)
+    elif isinstance(node, dict):
+        dict.__setitem__(node, path[-1], value)
+    else:
+        node[path[-1]] = value
+    return node
+
+
+def _children(node):
+    """(segment, child) pairs of an interior node, one level snapshotted at a time; None for a leaf."""
+    if isinstance(node, (CompactTree, TreeSnapshot)):
+        node = node._root
+    elif isinstance(node, PersistentTree):
+        node = node.snapshot()._root
+    if isinstance(node, _Node):
+        return list(zip(node.keys, node.values))
+    if isinstance(node, dict):
+        return list(dict.items(node))
+    if isinstance(node, Mapping):
+        return list(node.items())
+    return None
+
+
+def _join(prefix, segment):
+    return '%s:%s' % (prefix, segment) if prefix else segment
+
+
+def _iter_leaves(node, prefix):
+    children = _children(node)
+    if children is None:
+        yield prefix, node
+        return
+
+    for segment, child in children:
+        for item in _iter_leaves(child, _join(prefix, segment)):
+            yield item
+
+
+def iter_tree_leaves(mapping, prefix=''):
+    """
+    Lazily iterate over (path, value) of every leaf under `prefix` of a tree-like mapping structure.
+
+    >>> sorted(iter_tree_leaves({'a': {'b': 1, 'c': {'d': 2}}, 'e': 3}, 'a'))
+    [('a:b', 1), ('a:c:d', 2)]
+
+    Arguments:
+        mapping collections.Mapping: Mapping to query
+        prefix str|unicode: Key of the node to start from, allowing for : notation. Defaults to the root.
+
+    Returns:
+        generator: (path, value) tuples
+    """
+    node = get_tree_node(mapping, prefix, default=_missing) if prefix else mapping
+    if node is _missing:
+        return iter(())
+    return _iter_leaves(node, prefix)
+
+
+# Matcher kinds of a compiled glob segment
+_LITERAL, _ANY, _PATTERN, _RECURSIVE = range(4)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_glob(pattern):
+    """
+    Compile a ':' delimited glob into per segment matchers.
+
+    Segments are matched with `fnmatch` rules, where `*` matches any one segment, and a `**` segment matches any
+    number of segments (including none).
+
+    Arguments:
+        pattern str|unicode: Glob, ie `plugins:http:*` or `plugins:**:get`
+
+    Returns:
+        tuple: ((kind, argument), ...)
+    """
+    matchers = []
+    for segment in compile_path(pattern):
+        if segment == '**':
+            if matchers and matchers[-1][0] == _RECURSIVE:
+                continue  # Consecutive ones would only yield duplicates
+            matchers.append((_RECURSIVE, None))
+        elif segment == '*':
+            matchers.append((_ANY, None))
+        elif any(char in segment for char in '*?['):
+            matchers.append((_PATTERN, re.compile(fnmatch.translate(segment)).match))
+        else:
+            matchers.append((_LITERAL, segment))
+    return tuple(matchers)
+
+
+def _glob(node, prefix, matchers, i):
+    if i == len(matchers):
+        if _children(node) is None:
+            yield prefix, node
+        return
+
+    kind, argument = matchers[i]
+
+    if kind == _LITERAL:
+        child = get_tree_node(node, (argument, ), default=_missing)
+        if child is not _missing:
+            for item in _glob(child, _join(prefix, argument), matchers, i + 1):
+                yield item
+        return
+
+    children = _children(node)
+    if kind == _RECURSIVE:
+        # Matching no segments
+        for item in _glob(node, prefix, matchers, i + 1):
+            yield item
+        if children is None:
+            return
+        # Or one more, staying on this matcher
+        for segment, child in children:
+            for item in _glob(child, _join(prefix, segment), matchers, i):
+                yield item
+        return
+
+    if children is None:
+        return
+    for segment, child in children:
+        if kind == _ANY or argument(str(segment)):
+            for item in _glob(child, _join(prefix, segment), matchers, i + 1):
+                yield item
+
+
+def glob_tree_nodes(mapping, pattern):
+    """
+    Lazily iterate over (path, value) of every leaf of a tree-like mapping structure whose path matches `pattern`.
+
+    See `compile_glob` for the syntax. Literal leading segments are looked up directly (through `Tree`'s index),
+    and only the subtrees wildcards apply to are walked, a level at a time.
+
+    >>> registry = {'plugins': {'http': {'get': 1, 'post': 2}, 'ftp': {'get': 3}}}
+    >>> sorted(glob_tree_nodes(registry, 'plugins:http:*'))
+    [('plugins:http:get', 1), ('plugins:http:post', 2)]
+    >>> sorted(glob_tree_nodes(registry, 'plugins:**:get'))
+    [('plugins:ftp:get', 3), ('plugins:http:get', 1)]
+
+    Arguments:
+        mapping collections.Mapping: Mapping to query
+        pattern str|unicode: Glob to match leaf paths against
+
+    Returns:
+        generator: (path, value) tuples
+    """
+    matchers = compile_glob(pattern)
+
+    # Jump straight to the node the leading literal segments lead to
+    literal = 0
+    while literal < len(matchers) and matchers[literal][0] == _LITERAL:
+        literal += 1
+
+    node, prefix = mapping, ''
+    if literal:
+        prefix = ':'.join(argument for _, argument in matchers[:literal])
+        node = get_tree_node(mapping, prefix, default=_missing)
+        if node is _missing:
+            return iter(())
+
+    return _glob(node, prefix, matchers, literal)
 
 
 def tree():
@@ -66,37 +325,868 @@ class Tree(collections.defaultdict):
     Same extremely simple tree based on defaultdict as `tree`, but implemented as a class for extensibility.
     Use ':' to delve down into dimensions without choosing doors [][][] .
     Supports specifying a namespace that acts as a key prefix.
+
+    Keeps a flat index of {full path: node}, shared by all of its nodes and kept in sync as they are set through the
+    tree, so reads (including parent lookups) are a single dict lookup. Values read through plain mappings stored in
+    the tree are not indexed, as those can change behind its back.
+
+    >>> t = Tree()
+    >>> t['a:b:c'] = 1
+    >>> t['a:b:c'], t['a']['b:c'], get_tree_node(t, 'a:b:c', parent=True)
+    (1, 1, Tree(<class 'pytutils.trees.Tree'>, {'c': 1}))
+    >>> t['a:b'] = 2
+    >>> t['a:b'], t.get('a:b:c', None)
+    (2, None)
+
+    Nodes stored under several paths and writes through any `dict` method are kept in sync too:
+
+    >>> t['x'] = t['a']
+    >>> t['x:b'], t.setdefault('x:c', 3)
+    (2, 3)
+    >>> t['a:b'] = 4
+    >>> t['x:b'], t['a:c']
+    (4, 3)
+    >>> t.popitem()[0], t.get('x', None)
+    ('x', None)
     """
     namespace = None
 
-    def __init__(self, initial=None, namespace='', initial_is_ref=False):
+    def __init__(self, initial=None, namespace='', initial_is_ref=False, index=True):
         if initial is not None and initial_is_ref:
             self.data = initial_is_ref
         self.namespace = namespace
+        self._index = {} if index else None
+        self._prefix = ''
         super(Tree, self).__init__(self.__class__)
         if initial is not None:
             self.update(initial)
 
     def _namespace_key(self, key, namespace=_sentinel):
-        if namespace is _sentinel:
+        if namespace is _sentinel or namespace is None:
             namespace = self.namespace
-        if namespace:
-            key = '%s:%s' % (namespace, key)
-        return key
+        return _namespaced(namespace, key)
+
+    def _make_child(self, segment):
+        child = self.__class__(index=False)
+        child._index = self._index
+        child._prefix = sys.intern('%s%s:' % (self._prefix, segment))
+        self._assign(segment, child)
+        return child
+
+    def _get_path(self, key, default=_sentinel, parent=False):
+        if parent:
+            key = key.rpartition(':')[0]
+            if not key:
+                return self
+
+        index = self._index
+        if index is not None:
+            index_key = self._prefix + key if self._prefix else key
+            node = index.get(index_key, _sentinel)
+            if node is not _sentinel:
+                return node
+
+        node = self
+        indexable = index is not None
+        walked = self._prefix
+        try:
+            for segment in compile_path(key):
+                # Only nodes living at the path walked so far are kept in sync; not ones also stored elsewhere (aliases)
+                indexable = indexable and isinstance(node, Tree) and node._index is index and node._prefix == walked
+                node = _child(node, segment)
+                if indexable:
+                    walked = '%s%s:' % (walked, segment)
+        except KeyError:
+            if default is _sentinel:
+                raise
+            return default
+
+        if indexable:
+            index[index_key] = node
+        return node
+
+    def _set_path(self, key, value):
+        path = compile_path(key)
+        node = self
+        for segment in path[:-1]:
+            node = _vivify(node, segment)
+
+        if isinstance(node, Tree):
+            node._assign(path[-1], value)
+        else:
+            set_tree_node(node, path[-1:], value)
+        return node
+
+    def _assign(self, segment, value):
+        index = self._index
+        if index is not None:
+            index_key = self._prefix + segment
+            old = dict.get(self, segment, _sentinel)
+            if old is not _sentinel:
+                self._unindex(index_key, old)
+            index[index_key] = value
+        dict.__setitem__(self, segment, value)
+
+    def _remove(self, segment):
+        old = dict.pop(self, segment)
+        if self._index is not None:
+            self._unindex(self._prefix + segment, old)
+        return old
+
+    def _unindex(self, index_key, node):
+        """Drop `index_key` and everything below it from the index, detaching replaced nodes from it."""
+        index = self._index
+        index.pop(index_key, None)
+
+        # Nodes stored elsewhere too (aliases) stay indexed under their own path
+        if isinstance(node, Tree) and node._index is index and node._prefix == index_key + ':':
+            node._index = None
+            for segment, child in dict.items(node):
+                self._unindex('%s:%s' % (index_key, segment), child)
+
+    def reindex(self):
+        """Drop the index, to be lazily rebuilt by reads; ie after nodes were changed with plain `dict` methods."""
+        if self._index is not None:
+            self._index.clear()
 
     def __setitem__(self, key, value, namespace=None):
         key = self._namespace_key(key, namespace=namespace)
-        return set_tree_node(self, key, value)
+        return self._set_path(key, value)
 
     def __getitem__(self, key, default=_sentinel, namespace=None):
-        key = self._namespace_key(key, namespace=namespace)
-        return get_tree_node(self, key, default=default)
+        if namespace is None:
+            namespace = self.namespace
+        if namespace:
+            key = _namespaced(namespace, key)
+
+        # Fast path for the root
+        index = self._index
+        if index is not None and not self._prefix:
+            node = index.get(key, _sentinel)
+            if node is not _sentinel:
+                return node
+
+        return self._get_path(key, default=default)
 
     get = __getitem__
 
+    def __delitem__(self, key, namespace=None):
+        key = self._namespace_key(key, namespace=namespace)
+        parent_key, _, segment = key.rpartition(':')
+        node = self._get_path(parent_key) if parent_key else self
+        if isinstance(node, Tree):
+            node._remove(compile_path(segment)[0])
+        else:
+            del node[segment]
+
+    def popitem(self):
+        segment, old = dict.popitem(self)
+        if self._index is not None:
+            self._unindex(self._prefix + segment, old)
+        return segment, old
+
+    def setdefault(self, key, default=None, namespace=None):
+        value = self.get(key, _missing, namespace=namespace)
+        if value is _missing:
+            self.__setitem__(key, default, namespace=namespace)
+            value = default
+        return value
+
+    def pop(self, key, default=_sentinel, namespace=None):
+        try:
+            value = self.__getitem__(key, namespace=namespace)
+        except KeyError:
+            if default is _sentinel:
+                raise
+            return default
+        self.__delitem__(key, namespace=namespace)
+        return value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for segment in list(dict.keys(self)):
+            self._remove(segment)
+
+    def iter_prefix(self, prefix='', namespace=None):
+        """
+        Lazily iterate over (path, value) of every leaf under `prefix`; see `iter_tree_leaves`.
+
+        Paths are relative to the namespace.
+        """
+        return self._query(iter_tree_leaves, prefix, namespace)
+
+    def glob(self, pattern, namespace=None):
+        """
+        Lazily iterate over (path, value) of every leaf matching `pattern`; see `glob_tree_nodes`.
+
+        Paths are relative to the namespace.
+
+        >>> registry = RegistryTree(namespace='plugins')
+        >>> registry['http:get'] = 1
+        >>> registry['http:post'] = 2
+        >>> registry['ftp:get'] = 3
+        >>> sorted(registry.glob('http:*'))
+        [('http:get', 1), ('http:post', 2)]
+        >>> sorted(registry.iter_prefix('ftp'))
+        [('ftp:get', 3)]
+        """
+        return self._query(glob_tree_nodes, pattern, namespace)
+
+    def _query(self, func, pattern, namespace):
+        if namespace is None:
+            namespace = self.namespace
+        if not namespace:
+            return func(self, pattern)
+
+        strip = len(namespace) + 1
+        results = func(self, _namespaced(namespace, pattern) if pattern else namespace)
+        return ((path[strip:], value) for path, value in results)
+
 
 class RegistryTree(Tree):
 
     # Alias
     register = Tree.__setitem__
 
+
+class _Node(object):
+    """Interior node of a `CompactTree`: child segments in sorted order, and the child nodes or leaf values."""
+    __slots__ = ('keys', 'values')
+
+    def __init__(self, keys=None, values=None):
+        self.keys = keys if keys is not None else []
+        self.values = values if values is not None else []
+
+    def find(self, segment):
+        keys = self.keys
+        i = bisect.bisect_left(keys, segment)
+        if i < len(keys) and keys[i] == segment:
+            return self.values[i]
+        return _sentinel
+
+    def put(self, segment, value):
+        keys = self.keys
+        i = bisect.bisect_left(keys, segment)
+        if i < len(keys) and keys[i] == segment:
+            self.values[i] = value
+        else:
+            keys.insert(i, segment)
+            self.values.insert(i, value)
+
+    def remove(self, segment):
+        keys = self.keys
+        i = bisect.bisect_left(keys, segment)
+        if i == len(keys) or keys[i] != segment:
+            raise KeyError(segment)
+        del keys[i]
+        return self.values.pop(i)
+
+
+class CompactTree(MutableMapping):
+    """
+    Memory lean alternative to `Tree` with the same ':' path API, for registries with millions of entries.
+
+    Rather than a dict per interior node, each holds its (interned) child segments in a sorted list searched with
+    `bisect`, next to a list of child nodes and leaf values; leaves cost no node at all. Lookups are O(log(width))
+    per level instead of O(1); inserting out of order into very wide nodes is O(width), so bulk load with
+    `from_mapping` or in sorted order where possible.
+
+    Reading an interior node returns a `CompactTree` view sharing it.
+
+    >>> t = CompactTree(namespace='plugins')
+    >>> t['http:get'] = 1
+    >>> t['http:post'] = 2
+    >>> t['http:get'], sorted(t['http']), get_tree_node(t, 'plugins:http:post')
+    (1, ['get', 'post'], 2)
+    >>> del t['http:get']
+    >>> t.get('http:get', None) is None
+    True
+    >>> CompactTree({'a': {'b': 1}})['a:b']
+    1
+    """
+    __slots__ = ('_root', 'namespace')
+
+    def __init__(self, initial=None, namespace='', _root=None):
+        self._root = _root if _root is not None else _Node()
+        self.namespace = namespace
+        if initial is not None:
+            self.update(initial)
+
+    @classmethod
+    def from_mapping(cls, mapping, namespace=''):
+        """
+        Build from a nested mapping (ie a `Tree` or a parsed config), turning every nested mapping into a node.
+        """
+        return cls(namespace=namespace, _root=cls._build(mapping))
+
+    @classmethod
+    def _build(cls, mapping):
+        if isinstance(mapping, CompactTree):
+            return mapping._root
+
+        items = sorted((sys.intern(str(segment)), value) for segment, value in mapping.items())
+        return _Node(
+            [segment for segment, _ in items],
+            [cls._build(value) if isinstance(value, Mapping) else value for _, value in items],
+        )
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, dict(self.items()))
+
+    def _wrap(self, value):
+        if isinstance(value, _Node):
+            return self.__class__(_root=value)
+        return value
+
+    def _get_path(self, key, default=_sentinel, parent=False):
+        path = compile_path(key)
+        if parent:
+            path = path[:-1]
+
+        node = self._root
+        bisect_left = bisect.bisect_left
+        for segment in path:
+            # Inlined `_Node.find`, this being the hot path
+            if type(node) is not _Node:
+                break
+            keys = node.keys
+            i = bisect_left(keys, segment)
+            if i == len(keys) or keys[i] != segment:
+                break
+            node = node.values[i]
+        else:
+            return self.__class__(_root=node) if type(node) is _Node else node
+
+        if default is _sentinel:
+            raise KeyError(key)
+        return default
+
+    def _set_path(self, key, value):
+        if isinstance(value, Mapping):
+            # Nested mappings become nodes (sharing those of a `CompactTree`), so their keys are reachable by path
+            value = self._build(value)
+
+        path = compile_path(key)
+        node = self._root
+        for segment in path[:-1]:
+            child = node.find(segment)
+            if child is _sentinel:
+                child = _Node()
+                node.put(segment, child)
+            elif not isinstance(child, _Node):
+                raise KeyError(key)  # a leaf value in the way
+            node = child
+
+        node.put(path[-1], value)
+        return self.__class__(_root=node)
+
+    def __getitem__(self, key, default=_sentinel, namespace=None):
+        if namespace is None:
+            namespace = self.namespace
+        if namespace:
+            key = _namespaced(namespace, key)
+        return self._get_path(key, default=default)
+
+    get = __getitem__
+
+    def __setitem__(self, key, value, namespace=None):
+        if namespace is None:
+            namespace = self.namespace
+        return self._set_path(_namespaced(namespace, key), value)
+
+    def __delitem__(self, key, namespace=None):
+        if namespace is None:
+            namespace = self.namespace
+        key = _namespaced(namespace, key)
+
+        parent = self._get_path(key, parent=True) if ':' in key else self
+        if not isinstance(parent, CompactTree):
+            raise KeyError(key)
+        parent._root.remove(compile_path(key)[-1])
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self._root.keys)
+
+    def __len__(self):
+        return len(self._root.keys)
+
+    def items(self):
+        return [(segment, self._wrap(value)) for segment, value in zip(self._root.keys, self._root.values)]
+
+    def leaves(self, prefix=''):
+        """
+        Iterate over (full path, value) of every leaf below this node, in sorted order.
+        """
+        return self._leaves(self._root, prefix)
+
+    @classmethod
+    def _leaves(cls, node, prefix):
+        for segment, value in zip(node.keys, node.values):
+            path = '%s:%s' % (prefix, segment) if prefix else segment
+            if isinstance(value, _Node):
+                for item in cls._leaves(value, path):
+                    yield item
+            else:
+                yield path, value
+
+    def clear(self):
+        self._root.keys, self._root.values = [], []
+
+    iter_prefix = Tree.iter_prefix
+    glob = Tree.glob
+    _query = Tree._query
+
+
+class _PNode(dict):
+    """Interior node of a `PersistentTree`; never mutated once published."""
+    __slots__ = ()
+
+
+def _assoc(node, path, value):
+    """Copy of `node` with `value` set at `path`, copying only the nodes along it."""
+    new = _PNode(node)
+    segment = path[0]
+    if len(path) == 1:
+        new[segment] = value
+        return new
+
+    child = dict.get(node, segment, _sentinel)
+    if child is _sentinel:
+        child = _PNode()
+    elif not isinstance(child, _PNode):
+        raise KeyError(segment)  # a leaf value in the way
+
+    new[segment] = _assoc(child, path[1:], value)
+    return new
+
+
+def _dissoc(node, path):
+    """Copy of `node` without `path`, copying only the nodes along it."""
+    segment = path[0]
+    child = dict.get(node, segment, _sentinel)
+    if child is _sentinel or len(path) > 1 and not isinstance(child, _PNode):
+        raise KeyError(segment)
+
+    new = _PNode(node)
+    if len(path) == 1:
+        del new[segment]
+    else:
+        new[segment] = _dissoc(child, path[1:])
+    return new
+
+
+class TreeSnapshot(Mapping):
+    """
+    Immutable version of a `PersistentTree`, with the same ':' path read API as `Tree`.
+
+    Reading an interior node returns a `TreeSnapshot` of it.
+    """
+    __slots__ = ('_root', 'namespace', 'version')
+
+    def __init__(self, root=None, namespace='', version=0):
+        self._root = root if root is not None else _PNode()
+        self.namespace = namespace
+        self.version = version
+
+    def __repr__(self):
+        return '%s(%r, version=%d)' % (self.__class__.__name__, dict(self._root), self.version)
+
+    def _get_path(self, key, default=_sentinel, parent=False):
+        path = compile_path(key)
+        if parent:
+            path = path[:-1]
+
+        node = self._root
+        try:
+            for segment in path:
+                node = _child(node, segment)
+        except KeyError:
+            if default is _sentinel:
+                raise
+            return default
+
+        if isinstance(node, _PNode):
+            return self.__class__(node, version=self.version)
+        return node
+
+    def __getitem__(self, key, default=_sentinel, namespace=None):
+        if namespace is None:
+            namespace = self.namespace
+        if namespace:
+            key = _namespaced(namespace, key)
+        return self._get_path(key, default=default)
+
+    get = __getitem__
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self._root)
+
+    def __len__(self):
+        return len(self._root)
+
+    iter_prefix = Tree.iter_prefix
+    glob = Tree.glob
+    _query = Tree._query
+
+
+class PersistentTree(object):
+    """
+    Copy on write tree with the same ':' path API as `Tree`, for many concurrent readers and the odd writer.
+
+    Versions are immutable and share structure: a write copies only the nodes along its path into a new root, then
+    publishes it with a single reference assignment. Readers never lock; `snapshot` grabs the current version, which
+    stays consistent however many writes follow, and is freed by refcounting once nobody holds it. Writers are
+    serialized by a lock; `update` applies several writes as one version.
+
+    Mappings are copied into tree nodes; other values are stored as is, so should be immutable themselves.
+
+    >>> config = PersistentTree()
+    >>> config['db:host'] = 'localhost'
+    >>> before = config.snapshot()
+    >>> config.update({'db:host': 'db1', 'db:port': 5432})
+    >>> before['db:host'], config['db:host'], config['db:port']
+    ('localhost', 'db1', 5432)
+    >>> before.version, config.snapshot().version
+    (1, 2)
+
+    >>> nested = PersistentTree({'db': {'host': 'x'}})
+    >>> nested['db:port'] = 5432
+    >>> del nested['db:host']
+    >>> nested['db']
+    TreeSnapshot({'port': 5432}, version=3)
+    """
+
+    def __init__(self, initial=None, namespace=''):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._snapshot = TreeSnapshot(namespace=namespace)
+        if initial is not None:
+            self.update(initial)
+
+    def __repr__(self):
+        return '%s(%r, version=%d)' % (self.__class__.__name__, dict(self._snapshot._root), self._snapshot.version)
+
+    def snapshot(self):
+        """
+        :return TreeSnapshot: Current version
+        """
+        return self._snapshot
+
+    def _publish(self, root):
+        self._snapshot = TreeSnapshot(root, namespace=self.namespace, version=self._snapshot.version + 1)
+
+    def _get_path(self, key, default=_sentinel, parent=False):
+        return self._snapshot._get_path(key, default=default, parent=parent)
+
+    def _set_path(self, key, value):
+        with self._lock:
+            self._publish(_assoc(self._snapshot._root, compile_path(key), self._unwrap(value)))
+
+    @classmethod
+    def _unwrap(cls, value):
+        # Share snapshots' nodes rather than nesting snapshots, and copy other mappings into nodes of our own, so paths
+        # lead into them and no snapshot shares mutable state with the caller
+        if isinstance(value, PersistentTree):
+            value = value.snapshot()
+        if isinstance(value, TreeSnapshot):
+            return value._root
+        if isinstance(value, _PNode):
+            return value
+        if isinstance(value, Mapping):
+            return _PNode((key, cls._unwrap(child)) for key, child in value.items())
+        return value
+
+    def __getitem__(self, key, default=_sentinel, namespace=None):
+        return self._snapshot.__getitem__(key, default=default, namespace=namespace)
+
+    get = __getitem__
+
+    def __setitem__(self, key, value, namespace=None):
+        if namespace is None:
+            namespace = self.namespace
+        if namespace:
+            key = _namespaced(namespace, key)
+        self._set_path(key, value)
+
+    def __delitem__(self, key, namespace=None):
+        if namespace is None:
+            namespace = self.namespace
+        if namespace:
+            key = _namespaced(namespace, key)
+
+        with self._lock:
+            self._publish(_dissoc(self._snapshot._root, compile_path(key)))
+
+    def __contains__(self, key):
+        return key in self._snapshot
+
+    def __iter__(self):
+        return iter(self._snapshot)
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def update(self, *args, **kwargs):
+        """
+        Set several keys at once, publishing them as a single new version.
+        """
+        items = dict(*args, **kwargs)
+        with self._lock:
+            root = self._snapshot._root
+            for key, value in items.items():
+                root = _assoc(root, compile_path(_namespaced(self.namespace, key)), self._unwrap(value))
+            self._publish(root)
+
+    def iter_prefix(self, prefix='', namespace=None):
+        """See `Tree.iter_prefix`; queries the current version."""
+        return self._snapshot.iter_prefix(prefix, namespace=namespace)
+
+    def glob(self, pattern, namespace=None):
+        """See `Tree.glob`; queries the current version."""
+        return self._snapshot.glob(pattern, namespace=namespace)
+
+
+# magic, entry count
+_IMAGE_HEADER = struct.Struct('<8sQ')
+# path offset, path length, value offset, value length; all 64bit so the table can be read as one array
+_IMAGE_ENTRY = struct.Struct('<QQQQ')
+_IMAGE_MAGIC = b'PYTTREE1'
+
+
+def dump_tree(mapping, filename, serializer=None):
+    """
+    Write a tree-like mapping structure to `filename` as a binary image for `MappedTree`.
+
+    The image is a table of every leaf's path sorted by path, followed by the paths and the serialized values.
+    It's written atomically, so processes still mapping a previous image keep reading it undisturbed.
+
+    Arguments:
+        mapping collections.Mapping: Tree to write; a `Tree`, `CompactTree`, `PersistentTree` or nested mappings
+        filename str|unicode: File to write
+        serializer object: Module or object with `dumps`/`loads` for values, ie `pickle` (default) or `msgpack`
+
+    Returns:
+        int: Number of leaves written
+    """
+    import pickle
+    from .files import burp
+
+    dumps = (serializer or pickle).dumps
+    leaves = sorted((path.encode('utf-8'), value) for path, value in iter_tree_leaves(mapping))
+
+    paths_offset = _IMAGE_HEADER.size + _IMAGE_ENTRY.size * len(leaves)
+    paths_size = sum(len(path) for path, _ in leaves)
+    values = [dumps(value) for _, value in leaves]
+
+    chunks = [_IMAGE_HEADER.pack(_IMAGE_MAGIC, len(leaves))]
+    path_offset, value_offset = paths_offset, paths_offset + paths_size
+    for (path, _), value in zip(leaves, values):
+        chunks.append(_IMAGE_ENTRY.pack(path_offset, len(path), value_offset, len(value)))
+        path_offset += len(path)
+        value_offset += len(value)
+    chunks.extend(path for path, _ in leaves)
+    chunks.extend(values)
+
+    burp(filename, chunks, mode='wb', compression=None, atomic=True)
+    return len(leaves)
+
+
+class _TreeImage(object):
+    """A memory mapped `dump_tree` image, and the values decoded from it so far."""
+
+    def __init__(self, filename, serializer=None):
+        import mmap
+        import pickle
+
+        with open(filename, 'rb') as fh:
+            self.mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count = _IMAGE_HEADER.unpack_from(self.mm, 0) if len(self.mm) >= _IMAGE_HEADER.size else (b'', 0)
+        if magic != _IMAGE_MAGIC:
+            self.mm.close()
+            raise ValueError('%r is not a tree image' % filename)
+
+        self.loads = (serializer or pickle).loads
+        self.values = {}
+
+        if sys.byteorder == 'little':
+            size = _IMAGE_ENTRY.size * self.count
+            self.table = memoryview(self.mm)[_IMAGE_HEADER.size:_IMAGE_HEADER.size + size].cast('Q')
+        else:
+            self.table = [
+                field for i in range(self.count)
+                for field in _IMAGE_ENTRY.unpack_from(self.mm, _IMAGE_HEADER.size + i * _IMAGE_ENTRY.size)
+            ]
+
+    def path(self, i):
+        table = self.table
+        offset = table[i * 4]
+        return self.mm[offset:offset + table[i * 4 + 1]]
+
+    def value(self, i):
+        try:
+            return self.values[i]
+        except KeyError:
+            offset, size = self.table[i * 4 + 2], self.table[i * 4 + 3]
+            value = self.values[i] = self.loads(self.mm[offset:offset + size])
+            return value
+
+    def close(self):
+        if isinstance(self.table, memoryview):
+            self.table.release()
+        self.mm.close()
+
+    def bisect(self, target, lo, hi):
+        """Index of the first path >= `target` within [lo, hi)."""
+        mm, table = self.mm, self.table
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = table[mid * 4]
+            if mm[offset:offset + table[mid * 4 + 1]] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class MappedTree(Mapping):
+    """
+    Read only tree over a `dump_tree` image, memory mapped and queried in place, with the same ':' path read API as
+    `Tree`.
+
+    Lookups binary search the sorted path table, and values are only deserialized when first read. As the image is
+    mapped read only, every process opening the same file shares one copy of it in the page cache.
+
+    Reading an interior node returns a `MappedTree` view of it.
+
+    >>> import os, tempfile
+    >>> filename = os.path.join(tempfile.mkdtemp(), 'registry.tree')
+    >>> dump_tree({'plugins': {'http': {'get': 1, 'post': 2}, 'ftp': {'get': 3}}}, filename)
+    3
+    >>> tree = MappedTree(filename, namespace='plugins')
+    >>> tree['http:get'], sorted(tree['http']), sorted(tree.glob('*:get'))
+    (1, ['get', 'post'], [('ftp:get', 3), ('http:get', 1)])
+    >>> tree.close()
+    """
+    __slots__ = ('_image', '_lo', '_hi', '_prefix', 'namespace')
+
+    def __init__(self, filename=None, serializer=None, namespace='', _view=None):
+        """
+        Arguments:
+            filename str|unicode: Image written by `dump_tree`
+            serializer object: Module or object with `loads`, matching what `dump_tree` was given
+            namespace str|unicode: Key prefix
+        """
+        if _view is not None:
+            self._image, self._lo, self._hi, self._prefix = _view
+        else:
+            self._image = _TreeImage(filename, serializer=serializer)
+            self._lo, self._hi, self._prefix = 0, self._image.count, b''
+        self.namespace = namespace
+
+    def __repr__(self):
+        return '<%s prefix=%r entries=%d>' % (self.__class__.__name__, self._prefix, self._hi - self._lo)
+
+    def _range(self, prefix):
+        """[lo, hi) of the paths below `prefix`, ie starting with `prefix:`."""
+        image = self._image
+        lo = image.bisect(prefix + b':', self._lo, self._hi)
+        hi = image.bisect(prefix + b';', lo, self._hi)  # ';' sorts right after ':'
+        return lo, hi
+
+    def _get_path(self, key, default=_sentinel, parent=False):
+        if parent:
+            key = key.rpartition(':')[0]
+            if not key:
+                return self
+
+        image = self._image
+        target = self._prefix + key.encode('utf-8')
+
+        i = image.bisect(target, self._lo, self._hi)
+        if i < self._hi and image.path(i) == target:
+            return image.value(i)
+
+        lo, hi = self._range(target)
+        if lo < hi:
+            return self.__class__(_view=(image, lo, hi, target + b':'))
+
+        if default is _sentinel:
+            raise KeyError(key)
+        return default
+
+    def __getitem__(self, key, default=_sentinel, namespace=None):
+        if namespace is None:
+            namespace = self.namespace
+        if namespace:
+            key = _namespaced(namespace, key)
+        return self._get_path(key, default=default)
+
+    get = __getitem__
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        """Child segments, in sorted order."""
+        skip = len(self._prefix)
+        last = None
+        for i in range(self._lo, self._hi):
+            segment = self._image.path(i)[skip:].split(b':', 1)[0]
+            if segment != last:
+                last = segment
+                yield segment.decode('utf-8')
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def _iter_prefix(self, prefix):
+        """(path, value) of every leaf under `prefix`, straight off the path table."""
+        image = self._image
+        if prefix:
+            target = self._prefix + prefix.encode('utf-8')
+            i = image.bisect(target, self._lo, self._hi)
+            if i < self._hi and image.path(i) == target:
+                yield prefix, image.value(i)
+                return
+            lo, hi = self._range(target)
+        else:
+            lo, hi = self._lo, self._hi
+
+        skip = len(self._prefix)
+        for i in range(lo, hi):
+            yield image.path(i)[skip:].decode('utf-8'), image.value(i)
+
+    def iter_prefix(self, prefix='', namespace=None):
+        """
+        Lazily iterate over (path, value) of every leaf under `prefix`, in sorted order; see `Tree.iter_prefix`.
+        """
+        return self._query(MappedTree._iter_prefix, prefix, namespace)
+
+    glob = Tree.glob
+    _query = Tree._query
+
+    def close(self):
+        """Unmap the image; this tree and all views of it are unusable afterwards."""
+        self._image.close()